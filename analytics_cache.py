@@ -0,0 +1,171 @@
+"""
+Dashboard analytics payload and its shared cache table.
+
+The payload is one JSON document built by SQLite. It is stored in
+analytics_cache_table so every web worker, and the nightly scheduler, share a
+single computed copy. Triggers on the source tables empty the cache on any
+write, so a stored payload is never older than the data it summarises.
+"""
+
+from datetime import datetime, timedelta
+
+# The whole dashboard payload is assembled by SQLite's JSON1 functions so no
+# intermediate Python dicts are built; each section is a scalar subquery and
+# the headline counts/sums come from one pass per table in `totals`.
+ANALYTICS_JSON_QUERY = """
+    WITH totals(tag, row_count, amount) AS MATERIALIZED (
+        SELECT 'dbc', COUNT(*), SUM(total_sales) FROM daily_book_closing_table
+        UNION ALL
+        SELECT 'pay', COUNT(*), SUM(CASE WHEN payment_status = 'pending' THEN total_amount END) FROM payments_table
+        UNION ALL
+        SELECT 'inv', COUNT(DISTINCT invoice_number), NULL FROM invoice_table
+    ),
+    -- Payment statuses in one pass over the covering index. Case and spacing are
+    -- normalised ('Paid' from the OCR output counts as 'paid'), every other value
+    -- keeps its own group, and only NULL or blank becomes 'unknown'
+    status_counts AS MATERIALIZED (
+        SELECT COALESCE(NULLIF(LOWER(TRIM(payment_status)), ''), 'unknown') AS status,
+               COUNT(*) AS count,
+               SUM(total_amount) AS amount
+        FROM payments_table
+        GROUP BY 1
+    )
+    SELECT json_object(
+        'summary', json_object(
+            'total_revenue', (SELECT COALESCE(amount, 0.0) FROM totals WHERE tag = 'dbc'),
+            'total_outstanding', (SELECT COALESCE(amount, 0.0) FROM totals WHERE tag = 'pay')
+        ),
+        'counts', json_object(
+            'daily_book_count', (SELECT row_count FROM totals WHERE tag = 'dbc'),
+            'payments_count', (SELECT row_count FROM totals WHERE tag = 'pay'),
+            'invoice_count', (SELECT row_count FROM totals WHERE tag = 'inv')
+        ),
+        'daily_sales', json((
+            SELECT json_group_array(json_object('date', closing_date, 'sales', COALESCE(total_sales, 0)))
+            FROM (
+                SELECT closing_date, total_sales
+                FROM daily_book_closing_table
+                WHERE closing_date >= :thirty_days_ago AND total_sales IS NOT NULL
+                ORDER BY closing_date DESC LIMIT 30
+            )
+        )),
+        'monthly_revenue', json((
+            SELECT json_group_array(json_object('year', year, 'month', month, 'revenue', revenue))
+            FROM (
+                SELECT year, month, revenue
+                FROM monthly_revenue_rollup
+                WHERE days > 0
+                ORDER BY year DESC, month DESC
+                LIMIT 12
+            )
+        )),
+        'payment_methods', json((
+            SELECT json_object('cash', COALESCE(SUM(cash_amount), 0),
+                               'credit', COALESCE(SUM(credit_amount), 0),
+                               'nets', COALESCE(SUM(nets_amount), 0),
+                               'nets_qr', COALESCE(SUM(nets_qr_amount), 0))
+            FROM daily_book_closing_table
+        )),
+        'top_suppliers', json((
+            SELECT json_group_array(json_object('name', supplier_name, 'amount', COALESCE(total, 0), 'count', invoice_count))
+            FROM (
+                SELECT supplier_name,
+                       SUM(total_amount) as total,
+                       COUNT(*) as invoice_count
+                FROM v_invoice_totals
+                GROUP BY supplier_name
+                ORDER BY total DESC
+                LIMIT 10
+            )
+        )),
+        'top_items', json((
+            SELECT json_group_array(json_object('name', item_name, 'quantity', COALESCE(total_qty, 0), 'amount', COALESCE(total_value, 0)))
+            FROM (
+                SELECT item_name,
+                       SUM(quantity) as total_qty,
+                       SUM(COALESCE(total_amount_per_item, amount_per_item, 0)) as total_value
+                FROM invoice_table
+                WHERE item_name IS NOT NULL
+                GROUP BY item_name
+                ORDER BY total_qty DESC
+                LIMIT 10
+            )
+        )),
+        'unpaid_invoices', json((
+            SELECT json_group_array(json_object('invoice_number', invoice_number,
+                                                'supplier_name', COALESCE(supplier_name, 'Unknown'),
+                                                'amount', COALESCE(total_amount, 0),
+                                                'due_date', COALESCE(payment_due_date, 'N/A')))
+            FROM (
+                SELECT invoice_number, supplier_name, total_amount, payment_due_date
+                FROM payments_table
+                WHERE payment_status = 'pending'
+                ORDER BY payment_due_date ASC
+                LIMIT 10
+            )
+        )),
+        'payment_status', json((
+            SELECT json_group_array(json_object('status', status, 'count', count, 'amount', COALESCE(amount, 0)))
+            FROM (SELECT status, count, amount FROM status_counts ORDER BY status)
+        ))
+    )
+"""
+
+DASHBOARD_METRIC = 'dashboard'
+
+ANALYTICS_CACHE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS analytics_cache_table (
+           metric_name TEXT PRIMARY KEY,
+           window_start TEXT NOT NULL,
+           value_json TEXT NOT NULL,
+           computed_at TIMESTAMP NOT NULL
+       )""",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_{short}_analytics_cache_{event.lower()}
+        AFTER {event} ON {table_name}
+        BEGIN
+            DELETE FROM analytics_cache_table;
+        END"""
+    for short, table_name in (('dbc', 'daily_book_closing_table'), ('pay', 'payments_table'), ('inv', 'invoice_table'))
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+ANALYTICS_CACHE_READ_QUERY = """
+    SELECT value_json FROM analytics_cache_table WHERE metric_name = ? AND window_start = ?
+"""
+
+# Computes the payload and stores it in one statement, handing it back through RETURNING
+ANALYTICS_CACHE_REFRESH_QUERY = f"""
+    INSERT INTO analytics_cache_table (metric_name, window_start, value_json, computed_at)
+    VALUES (:metric_name, :thirty_days_ago, ({ANALYTICS_JSON_QUERY}), CURRENT_TIMESTAMP)
+    ON CONFLICT (metric_name) DO UPDATE SET
+        window_start = excluded.window_start,
+        value_json = excluded.value_json,
+        computed_at = excluded.computed_at
+    RETURNING value_json
+"""
+
+
+def analytics_window_start():
+    """First day of the dashboard's 30-day daily sales window"""
+    return (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+
+
+def ensure_analytics_cache(conn):
+    """Create the cache table and its invalidation triggers if they are missing"""
+    for statement in ANALYTICS_CACHE_SCHEMA:
+        conn.execute(statement)
+
+
+def read_analytics_cache(conn, thirty_days_ago):
+    """The stored payload for this window, or None when it has been invalidated"""
+    row = conn.execute(ANALYTICS_CACHE_READ_QUERY, (DASHBOARD_METRIC, thirty_days_ago)).fetchone()
+    return row[0] if row else None
+
+
+def refresh_analytics_cache(conn, thirty_days_ago=None):
+    """Recompute the payload, store it and return it; run inside a write transaction"""
+    if thirty_days_ago is None:
+        thirty_days_ago = analytics_window_start()
+    params = {'metric_name': DASHBOARD_METRIC, 'thirty_days_ago': thirty_days_ago}
+    return conn.execute(ANALYTICS_CACHE_REFRESH_QUERY, params).fetchone()[0]
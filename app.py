@@ -1,19 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date, timedelta
-from functools import wraps
+from functools import wraps, lru_cache
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sqlite3
+import gzip
+import zlib
+import hashlib
+import logging
+import time
 import os
-import json
+import threading
+import uuid
+import numpy as np
+import orjson
+from analytics_cache import (ANALYTICS_CACHE_SCHEMA, analytics_window_start,
+                             read_analytics_cache, refresh_analytics_cache)
+from db_pool import DB_PATH as db_path, DB_POOL_SIZE, open_sqlite_connection, pool
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serve jsonify() and the tojson filter through orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = 'your-secret-key-change-this-in-production'
 
-# Use absolute path for database
-db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dailydelights.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'creator': open_sqlite_connection,
+    'pool_size': DB_POOL_SIZE,
+    'pool_pre_ping': False,
+}
 
 db = SQLAlchemy(app)
 
@@ -98,226 +126,704 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@app.before_request
+def load_current_user():
+    """Resolve the acting user once per request for handlers that record who made a change"""
+    if request.endpoint != 'static':
+        g.user = (session.get('username', 'web_user'), session.get('user_id', 'web'))
+
+# Connection pool for the raw SQLite code path (see db_pool.py)
+db_pool = pool
+
+# The Drive/email update scripts run for minutes, so they execute on this pool
+# instead of holding a request thread. One worker per script lets different
+# updates overlap, and a script that is already queued or running is not started
+# twice; callers that need a fresh pass (new uploads) get one coalesced rerun.
+# Job state lives in update_job_table so every gunicorn worker sees the same
+# jobs: a status poll can land on any worker, and the one-active-job-per-name
+# rule holds across processes.
+UPDATE_JOB_RETENTION_SECONDS = 3600
+# A pass still running after this long is reported as failed. Its thread cannot
+# be killed, so the job stays active (blocking another run of the same script)
+# until the thread has actually exited
+UPDATE_JOB_TIMEOUT_SECONDS = 1800
+# The worker running a job touches heartbeat_at this often; a job whose
+# heartbeat is older than UPDATE_JOB_STALE_SECONDS lost its process
+UPDATE_JOB_HEARTBEAT_SECONDS = 30
+UPDATE_JOB_STALE_SECONDS = 300
+update_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='update-job')
+
+UPDATE_JOB_SELECT = """
+    SELECT id, name, status, stats_json, message, category, created_at, finished_at
+    FROM update_job_table
+"""
+
+def _update_job_entry(row):
+    entry = dict(row)
+    stats_json = entry.pop('stats_json')
+    entry['stats'] = orjson.loads(stats_json) if stats_json else None
+    return entry
+
+def get_update_jobs(job_ids):
+    """Stored state of the given update jobs, keyed by job id"""
+    with db_pool.get() as conn:
+        rows = conn.execute(UPDATE_JOB_SELECT + "WHERE id IN (SELECT value FROM json_each(?))",
+                            (orjson.dumps(list(job_ids)).decode(),)).fetchall()
+    return {row['id']: _update_job_entry(row) for row in rows}
+
+def _run_pass(job_id, job, error_prefix):
+    """Run one pass of job() on a daemon thread, heartbeating its row until the thread exits.
+
+    Returns (status, stats, message, category, timed_out).
+    """
+    outcome = {}
+    def target():
+        try:
+            outcome['result'] = job()
+        except Exception as e:
+            outcome['error'] = e
+    worker = threading.Thread(target=target, name='update-job-pass', daemon=True)
+    started = time.time()
+    worker.start()
+
+    timed_out = False
+    while True:
+        worker.join(UPDATE_JOB_HEARTBEAT_SECONDS)
+        if not worker.is_alive():
+            break
+        now = time.time()
+        with db_pool.transaction(bump_generation=False) as conn:
+            if not timed_out and now - started > UPDATE_JOB_TIMEOUT_SECONDS:
+                timed_out = True
+                conn.execute("UPDATE update_job_table SET status = 'failed', message = ?, category = 'error' WHERE id = ?",
+                             (f'{error_prefix}: timed out after {UPDATE_JOB_TIMEOUT_SECONDS // 60} minutes', job_id))
+            conn.execute("UPDATE update_job_table SET heartbeat_at = ? WHERE id = ?", (now, job_id))
+
+    if timed_out:
+        return 'failed', None, f'{error_prefix}: timed out after {UPDATE_JOB_TIMEOUT_SECONDS // 60} minutes', 'error', True
+    if 'error' in outcome:
+        return 'failed', None, f'{error_prefix}: {str(outcome["error"])}', 'error', False
+    stats, message, category = outcome['result']
+    return 'finished', stats, message, category, False
+
+def start_update_job(name, job, error_prefix, rerun_if_running=False):
+    """Submit job() to the update pool unless `name` is already in flight in any worker.
+
+    job() returns (stats, message, flash category). With rerun_if_running, an
+    in-flight job runs once more after it finishes, however many callers asked.
+    Returns (job_id, started).
+    """
+    now = time.time()
+    # Job bookkeeping touches none of the cached tables
+    with db_pool.transaction(bump_generation=False) as conn:
+        # Jobs whose worker process died stop heartbeating and never finish; close
+        # them so they stop blocking new runs. Live jobs, even timed-out ones, stay active
+        conn.execute("""UPDATE update_job_table
+                        SET status = 'failed', message = ?, category = 'error', finished_at = ?
+                        WHERE finished_at IS NULL AND COALESCE(heartbeat_at, started_at, created_at) < ?""",
+                     ('Update stopped: its worker process exited', now, now - UPDATE_JOB_STALE_SECONDS))
+        conn.execute("DELETE FROM update_job_table WHERE finished_at < ?", (now - UPDATE_JOB_RETENTION_SECONDS,))
+
+        active = conn.execute("SELECT id FROM update_job_table WHERE name = ? AND finished_at IS NULL",
+                              (name,)).fetchone()
+        if active is not None:
+            if rerun_if_running:
+                conn.execute("UPDATE update_job_table SET rerun = 1 WHERE id = ?", (active['id'],))
+            return active['id'], False
+
+        job_id = uuid.uuid4().hex
+        conn.execute("INSERT INTO update_job_table (id, name, status, created_at) VALUES (?, ?, 'queued', ?)",
+                     (job_id, name, now))
+
+    def work():
+        while True:
+            now = time.time()
+            with db_pool.transaction(bump_generation=False) as conn:
+                conn.execute("UPDATE update_job_table SET status = 'running', started_at = ?, heartbeat_at = ? WHERE id = ?",
+                             (now, now, job_id))
+            status, stats, message, category, timed_out = _run_pass(job_id, job, error_prefix)
+
+            with db_pool.transaction(bump_generation=False) as conn:
+                # A rerun asked for by any worker while this pass ran is taken here,
+                # unless the pass hung, in which case it is dropped
+                rerun = conn.execute("UPDATE update_job_table SET rerun = 0 WHERE id = ? AND rerun = 1",
+                                     (job_id,)).rowcount and not timed_out
+                conn.execute("""UPDATE update_job_table
+                                SET status = ?, stats_json = ?, message = ?, category = ?, finished_at = ?
+                                WHERE id = ?""",
+                             (status, orjson.dumps(stats).decode() if stats is not None else None,
+                              message, category, None if rerun else time.time(), job_id))
+            if not rerun:
+                return
+
+    update_executor.submit(work)
+    return job_id, True
+
+def remember_update_job(job_id):
+    """Track a job on the session so its result is flashed once it finishes"""
+    session['update_jobs'] = list(dict.fromkeys(session.get('update_jobs', []) + [job_id]))
+
+def queue_update_job(name, job, label, error_prefix, endpoint):
+    """Start an update job and answer at once: 202 with the job id for API clients, else flash and redirect"""
+    job_id, started = start_update_job(name, job, error_prefix)
+    remember_update_job(job_id)
+
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': True, 'job_id': job_id, 'started': started,
+                        'status_url': url_for('api_job_status', job_id=job_id)}), 202
+
+    if started:
+        flash(f'{label} started in the background. Results will be shown here when it finishes.', 'info')
+    else:
+        flash(f'{label} is already running. Results will be shown here when it finishes.', 'info')
+    return redirect(url_for(endpoint))
+
+def daily_book_closing_job():
+    """Process daily book closing images from Google Drive in-process"""
+    from dailyBookClosing import run
+
+    stats = run()
+    if stats['total'] > 0:
+        return stats, f'Daily book closing update completed! Processed {stats["success"]} out of {stats["total"]} date groups successfully.', 'success'
+    return stats, 'Daily book closing update completed! No new images found to process.', 'info'
+
+def payments_job():
+    """Process the last 24 hours of UOB payment emails in-process"""
+    from uob_payment_emails import run
+
+    stats = run()
+    return stats, f'Payment update completed! Processed {stats["success"]}/{stats["total"]} payment emails from the last 24 hours.', 'success'
+
+def invoices_job():
+    """Process invoice images from Google Drive in-process"""
+    from stockSentinel import run
+
+    stats = run()
+    if stats['total'] > 0:
+        return stats, f'Invoice update completed! Processed {stats["success"]} out of {stats["total"]} invoices successfully.', 'success'
+    return stats, 'Invoice update completed! No new invoices found to process.', 'info'
+
+@app.before_request
+def flash_finished_update_jobs():
+    """Report update jobs this session started once they finish, on the next page load"""
+    pending = session.get('update_jobs')
+    if not pending or request.method != 'GET' or request.endpoint == 'static' or request.path.startswith('/api/'):
+        return
+
+    remaining = []
+    entries = get_update_jobs(pending)
+    for job_id in pending:
+        entry = entries.get(job_id)
+        if entry is None:
+            continue
+        if entry['finished_at']:
+            flash(entry['message'], entry['category'])
+        else:
+            remaining.append(job_id)
+    session['update_jobs'] = remaining
+
+# Indexes and other schema objects the web app relies on. Tables themselves are
+# created by the processing scripts, so each statement is applied independently.
+SCHEMA_OBJECTS = [
+    # Covering indexes for the dashboard analytics aggregations
+    "CREATE INDEX IF NOT EXISTS idx_dbc_date_sales ON daily_book_closing_table(closing_date, total_sales)",
+    # Search columns under NOCASE, matching LIKE's case-insensitivity: the
+    # recordsFiltered COUNT(*) scans these narrow covering indexes instead of the
+    # table, and prefix patterns ('term%') become index range searches
+    "CREATE INDEX IF NOT EXISTS idx_inv_search ON invoice_table(supplier_name COLLATE NOCASE, item_name COLLATE NOCASE, invoice_number COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_pay_search ON payments_table(supplier_name COLLATE NOCASE, invoice_number COLLATE NOCASE, payment_status COLLATE NOCASE)",
+    # Matches the daily book closing listing order, so it is read off the index with no sort
+    "CREATE INDEX IF NOT EXISTS idx_dbc_closing_date ON daily_book_closing_table(closing_date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_pay_status_amount ON payments_table(payment_status, total_amount, payment_due_date)",
+    "CREATE INDEX IF NOT EXISTS idx_inv_supplier ON invoice_table(supplier_name, invoice_number, total_amount)",
+    "CREATE INDEX IF NOT EXISTS idx_inv_item ON invoice_table(item_name, quantity, total_amount_per_item, amount_per_item)",
+    # One cash count per day; serves the BETWEEN range scan (read backwards for
+    # ORDER BY entry_date DESC) and the ON CONFLICT(entry_date) upsert target
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_cash_denom_entry_date ON cash_denomination_table(entry_date)",
+    # One row per invoice; grouped in idx_inv_supplier order so it is read straight off the index
+    """CREATE VIEW IF NOT EXISTS v_invoice_totals AS
+       SELECT supplier_name, invoice_number, MAX(total_amount) AS total_amount
+       FROM invoice_table
+       WHERE supplier_name IS NOT NULL
+       GROUP BY supplier_name, invoice_number""",
+    # Monthly revenue rollup for the dashboard chart. It is filled once from
+    # SCHEMA_SEEDS and then kept current by triggers, so edits made by the
+    # processing scripts count too.
+    """CREATE TABLE IF NOT EXISTS monthly_revenue_rollup (
+           year INTEGER NOT NULL,
+           month INTEGER NOT NULL,
+           revenue REAL NOT NULL DEFAULT 0,
+           days INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (year, month)
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS trg_dbc_monthly_insert
+       AFTER INSERT ON daily_book_closing_table
+       BEGIN
+           INSERT INTO monthly_revenue_rollup (year, month, revenue, days)
+           SELECT CAST(strftime('%Y', NEW.closing_date) AS INTEGER),
+                  CAST(strftime('%m', NEW.closing_date) AS INTEGER),
+                  NEW.total_sales, 1
+           WHERE NEW.total_sales IS NOT NULL AND strftime('%Y', NEW.closing_date) IS NOT NULL
+           ON CONFLICT (year, month) DO UPDATE SET revenue = revenue + excluded.revenue, days = days + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_dbc_monthly_update
+       AFTER UPDATE OF closing_date, total_sales ON daily_book_closing_table
+       BEGIN
+           UPDATE monthly_revenue_rollup
+           SET revenue = revenue - OLD.total_sales, days = days - 1
+           WHERE OLD.total_sales IS NOT NULL
+             AND year = CAST(strftime('%Y', OLD.closing_date) AS INTEGER)
+             AND month = CAST(strftime('%m', OLD.closing_date) AS INTEGER);
+           INSERT INTO monthly_revenue_rollup (year, month, revenue, days)
+           SELECT CAST(strftime('%Y', NEW.closing_date) AS INTEGER),
+                  CAST(strftime('%m', NEW.closing_date) AS INTEGER),
+                  NEW.total_sales, 1
+           WHERE NEW.total_sales IS NOT NULL AND strftime('%Y', NEW.closing_date) IS NOT NULL
+           ON CONFLICT (year, month) DO UPDATE SET revenue = revenue + excluded.revenue, days = days + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_dbc_monthly_delete
+       AFTER DELETE ON daily_book_closing_table
+       BEGIN
+           UPDATE monthly_revenue_rollup
+           SET revenue = revenue - OLD.total_sales, days = days - 1
+           WHERE OLD.total_sales IS NOT NULL
+             AND year = CAST(strftime('%Y', OLD.closing_date) AS INTEGER)
+             AND month = CAST(strftime('%m', OLD.closing_date) AS INTEGER);
+       END""",
+    # Trigram full-text index over the invoice search columns. It answers
+    # case-insensitive substring searches of 3+ characters without scanning
+    # invoice_table; triggers keep it in step with every writer, including the
+    # processing scripts, and it is filled once from SCHEMA_SEEDS
+    """CREATE VIRTUAL TABLE IF NOT EXISTS invoice_fts USING fts5(
+           supplier_name, item_name, invoice_number,
+           content='invoice_table', content_rowid='id', tokenize='trigram'
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS trg_invoice_fts_insert
+       AFTER INSERT ON invoice_table
+       BEGIN
+           INSERT INTO invoice_fts(rowid, supplier_name, item_name, invoice_number)
+           VALUES (NEW.id, NEW.supplier_name, NEW.item_name, NEW.invoice_number);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_invoice_fts_update
+       AFTER UPDATE OF supplier_name, item_name, invoice_number ON invoice_table
+       BEGIN
+           INSERT INTO invoice_fts(invoice_fts, rowid, supplier_name, item_name, invoice_number)
+           VALUES ('delete', OLD.id, OLD.supplier_name, OLD.item_name, OLD.invoice_number);
+           INSERT INTO invoice_fts(rowid, supplier_name, item_name, invoice_number)
+           VALUES (NEW.id, NEW.supplier_name, NEW.item_name, NEW.invoice_number);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_invoice_fts_delete
+       AFTER DELETE ON invoice_table
+       BEGIN
+           INSERT INTO invoice_fts(invoice_fts, rowid, supplier_name, item_name, invoice_number)
+           VALUES ('delete', OLD.id, OLD.supplier_name, OLD.item_name, OLD.invoice_number);
+       END""",
+    # Shared dashboard payload, emptied by triggers whenever its source tables change
+    *ANALYTICS_CACHE_SCHEMA,
+    # Background update jobs, shared by all web workers (see start_update_job)
+    """CREATE TABLE IF NOT EXISTS update_job_table (
+           id TEXT PRIMARY KEY,
+           name TEXT NOT NULL,
+           status TEXT NOT NULL,
+           stats_json TEXT,
+           message TEXT,
+           category TEXT,
+           rerun INTEGER NOT NULL DEFAULT 0,
+           created_at REAL NOT NULL,
+           started_at REAL,
+           heartbeat_at REAL,
+           finished_at REAL
+       )""",
+    # At most one unfinished job per update name, whichever worker started it
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_update_job_active ON update_job_table(name) WHERE finished_at IS NULL",
+    # Derived tables from SCHEMA_SEEDS that have been filled
+    """CREATE TABLE IF NOT EXISTS schema_seed_table (
+           name TEXT PRIMARY KEY,
+           seeded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+       )""",
+]
+
+# One-off backfills of the trigger-maintained tables above, keyed by table. A
+# seed runs at startup only until it has succeeded once (recorded in
+# schema_seed_table); after that the triggers keep the table current, so
+# worker restarts and scripts importing app.py do no full-table work.
+SCHEMA_SEEDS = {
+    'monthly_revenue_rollup': [
+        "DELETE FROM monthly_revenue_rollup",
+        """INSERT INTO monthly_revenue_rollup (year, month, revenue, days)
+           SELECT CAST(strftime('%Y', closing_date) AS INTEGER) AS year,
+                  CAST(strftime('%m', closing_date) AS INTEGER) AS month,
+                  SUM(total_sales), COUNT(*)
+           FROM daily_book_closing_table
+           WHERE total_sales IS NOT NULL AND strftime('%Y', closing_date) IS NOT NULL
+           GROUP BY year, month""",
+    ],
+    'invoice_fts': [
+        "INSERT INTO invoice_fts(invoice_fts) VALUES ('rebuild')",
+    ],
+}
+
+def ensure_schema_objects():
+    """Create missing indexes and other schema objects at startup, seeding new derived tables"""
+    # One IMMEDIATE transaction, so workers starting together take turns and
+    # only the first of them runs a pending seed
+    with db_pool.transaction() as conn:
+        for statement in SCHEMA_OBJECTS:
+            try:
+                conn.execute(statement)
+            except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
+                logger.warning("Schema setup skipped (%s): %s", e, statement.split(' ON ')[0].split(' AS')[0])
+
+        seeded = {row[0] for row in conn.execute("SELECT name FROM schema_seed_table")}
+        for name, statements in SCHEMA_SEEDS.items():
+            if name in seeded:
+                continue
+            conn.execute("SAVEPOINT schema_seed")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_seed_table (name) VALUES (?)", (name,))
+                conn.execute("RELEASE schema_seed")
+            except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
+                # Usually the source table does not exist yet; retried on the next start
+                conn.execute("ROLLBACK TO schema_seed")
+                conn.execute("RELEASE schema_seed")
+                logger.warning("Seeding %s skipped (%s)", name, e)
+
+ensure_schema_objects()
+
+DEBUG_TABLES = ('daily_book_closing_table', 'payments_table', 'invoice_table')
+
+def column_affinity(declared_type):
+    """SQLite's type affinity for a declared column type (the rules in section 3.1 of datatype3.html)"""
+    declared_type = declared_type.upper()
+    if 'INT' in declared_type:
+        return 'INTEGER'
+    if 'CHAR' in declared_type or 'CLOB' in declared_type or 'TEXT' in declared_type:
+        return 'TEXT'
+    if 'BLOB' in declared_type or not declared_type:
+        return 'BLOB'
+    if 'REAL' in declared_type or 'FLOA' in declared_type or 'DOUB' in declared_type:
+        return 'REAL'
+    return 'NUMERIC'
+
+# PRAGMA table_info results per table, read on first use. On a fresh database
+# the processing scripts create the tables later, so an empty result is not
+# kept and the next call reads the schema again.
+_table_schemas = {}
+
+def _table_schema(table_name):
+    """(columns, writable columns, numeric-affinity columns) of a table; table_name is internal, never user input"""
+    schema = _table_schemas.get(table_name)
+    if schema is None:
+        with db_pool.get() as conn:
+            info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+        columns = [col[1] for col in info]
+        # Only writable names are ever interpolated into CRUD SQL, which also keeps
+        # the set of statement shapes bounded for sqlite3's statement cache.
+        # SQLite itself converts well-formed numeric text for numeric-affinity columns.
+        schema = (columns, frozenset(columns) - {'id'},
+                  frozenset(col[1] for col in info if column_affinity(col[2]) in ('INTEGER', 'REAL', 'NUMERIC')))
+        if columns:
+            _table_schemas[table_name] = schema
+    return schema
+
+def table_columns(table_name):
+    """Column names of a table, in table order"""
+    return _table_schema(table_name)[0]
+
+def writable_columns(table_name):
+    """Columns CRUD inserts and updates may set (all but id)"""
+    return _table_schema(table_name)[1]
+
+def numeric_affinity_columns(table_name):
+    """Columns SQLite itself converts well-formed numeric text into numbers for on write"""
+    return _table_schema(table_name)[2]
+
 # Direct database functions using SQLite
 def get_direct_data(table_name):
     """Get data directly from SQLite database"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {table_name} ORDER BY id DESC")
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-        conn.close()
-        
         data = []
-        for row in rows:
-            row_dict = {}
-            for i, value in enumerate(row):
-                row_dict[columns[i]] = value
-            data.append(row_dict)
-        
+        with db_pool.get() as conn:
+            cursor = conn.execute(f"SELECT * FROM {table_name} ORDER BY id DESC")
+            while True:
+                batch = cursor.fetchmany(1000)
+                if not batch:
+                    break
+                data.extend(dict(row) for row in batch)
         return data
     except Exception as e:
         print(f"Direct database error for {table_name}: {e}")
         return []
 
-def execute_direct_query(query, params=None):
-    """Execute direct SQL query"""
+def execute_direct_query(query, params=None, many=False):
+    """Execute direct SQL query; with many=True, params is a sequence of parameter rows"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        conn.commit()
-        result = cursor.rowcount
-        conn.close()
-        return result
+        # One IMMEDIATE transaction, so an executemany is a single commit
+        with db_pool.transaction() as conn:
+            if many:
+                cursor = conn.executemany(query, params)
+            else:
+                cursor = conn.execute(query, params or ())
+        return cursor.rowcount
+    except sqlite3.IntegrityError:
+        # A constraint violation is the caller's input (e.g. a repeated closing date), not a server error
+        raise
     except Exception as e:
         print(f"Direct query error: {e}")
         return False
 
+# Numeric form fields per table; everything else is stored as submitted.
+# Frozensets keep each membership test a hash lookup.
+DBC_FLOAT_COLUMNS = frozenset({'total_sales', 'average_sales_per_transaction', 'nets_qr_amount',
+                               'cash_amount', 'credit_amount', 'nets_amount', 'total_settlement',
+                               'expected_cash_balance', 'voided_amount'})
+DBC_INT_COLUMNS = frozenset({'number_of_transactions', 'voided_transactions'})
+PAYMENT_FLOAT_COLUMNS = frozenset({'total_amount'})
+INVOICE_FLOAT_COLUMNS = frozenset({'total_amount', 'unit_price', 'unit_price_item', 'amount_per_item',
+                                   'gst_amount', 'total_amount_per_item'})
+INVOICE_INT_COLUMNS = frozenset({'quantity', 'items_per_carton'})
+
+def _coerce_row(form_dict, float_columns=frozenset(), int_columns=frozenset()):
+    """Convert submitted values: empty strings become None and numeric fields are parsed"""
+    # Compare against '' rather than relying on truthiness, so JSON rows keep their 0 values
+    row = {key: None if value == '' else value for key, value in form_dict.items()}
+    for key in float_columns & row.keys():
+        if row[key] is not None:
+            row[key] = float(row[key])
+    for key in int_columns & row.keys():
+        if row[key] is not None:
+            row[key] = int(row[key])
+    return row
+
+def submitted_rows():
+    """Rows posted to an add route: a JSON list for bulk imports, otherwise the single form"""
+    if request.is_json:
+        payload = request.get_json()
+        return payload if isinstance(payload, list) else [payload]
+    return [request.form.to_dict()]
+
+@lru_cache(maxsize=64)
+def _insert_sql(table_name, columns):
+    """INSERT text for a column tuple; identical text lets sqlite3's statement cache reuse the plan"""
+    placeholders = ', '.join(['?' for _ in columns])
+    return f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+@lru_cache(maxsize=64)
+def _update_sql(table_name, columns):
+    """UPDATE-by-id text for a column tuple"""
+    set_clause = ', '.join([f"{key} = ?" for key in columns])
+    return f"UPDATE {table_name} SET {set_clause} WHERE id = ?"
+
+def insert_rows(table_name, rows):
+    """Insert rows with one prepared statement and a single commit; unknown columns are dropped"""
+    allowed = writable_columns(table_name)
+    columns = tuple(column for column in dict.fromkeys(column for row in rows for column in row)
+                    if column in allowed)
+    if not columns:
+        return False
+    return execute_direct_query(_insert_sql(table_name, columns),
+                                [tuple(row.get(column) for column in columns) for row in rows], many=True)
+
+def update_row(table_name, record_id, row):
+    """Update one record by id with the cached statement for its columns; unknown columns are dropped"""
+    allowed = writable_columns(table_name)
+    columns = tuple(column for column in row if column in allowed)
+    if not columns:
+        return False
+    return execute_direct_query(_update_sql(table_name, columns), [row[column] for column in columns] + [record_id])
+
 def get_record_by_id(table_name, record_id):
     """Get single record by ID"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (record_id,))
-        columns = [description[0] for description in cursor.description]
-        row = cursor.fetchone()
-        conn.close()
-
-        if row:
-            row_dict = {}
-            for i, value in enumerate(row):
-                row_dict[columns[i]] = value
-            return row_dict
-        return None
+        with db_pool.get() as conn:
+            row = conn.execute(f"SELECT * FROM {table_name} WHERE id = ?", (record_id,)).fetchone()
+        return dict(row) if row else None
     except Exception as e:
         print(f"Error getting record by ID: {e}")
         return None
 
+# One fixed DELETE per table, so each is prepared once per pooled connection
+DELETE_BY_ID_QUERIES = {
+    table_name: f"DELETE FROM {table_name} WHERE id = ?"
+    for table_name in ('daily_book_closing_table', 'payments_table', 'invoice_table',
+                       'order_recommendations', 'price_changes')
+}
+
+def ojsonify(payload, status=200):
+    """Return orjson bytes directly, skipping the provider's str round-trip; NumPy values serialize natively"""
+    return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), status=status, mimetype='application/json')
+
+# JSON responses are gzipped for clients that accept it. NDJSON is left alone so
+# its lines still reach the reader as they are produced
+COMPRESS_MIMETYPES = frozenset({'application/json'})
+COMPRESS_LEVEL = 4
+COMPRESS_MIN_SIZE = 1024
+
+def _gzip_stream(chunks):
+    """Gzip a streamed body chunk by chunk, so it is never held in memory whole"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.after_request
+def gzip_json_response(response):
+    if (response.mimetype not in COMPRESS_MIMETYPES or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    # Set before any early return, so caches keep the identity and gzip bodies apart
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings.quality('gzip'):
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_stream(response.iter_encoded())
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # The gzip and identity bodies differ byte for byte, so they cannot share a
+    # strong validator. A weak one still matches If-None-Match, which Werkzeug
+    # compares weakly, so 304s keep working for both encodings
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Columns the DataTables search box and the /api/search endpoints match against
+DATATABLE_SEARCH_COLUMNS = {
+    'daily_book_closing_table': ('closing_date', 'cash_outs'),
+    'payments_table': ('supplier_name', 'invoice_number', 'payment_status'),
+    'invoice_table': ('supplier_name', 'item_name', 'invoice_number'),
+}
+
+def load_fts_tables():
+    """Full-text indexes that exist in this database, keyed by the table they index"""
+    with db_pool.get() as conn:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {table_name: fts_table for table_name, fts_table in (('invoice_table', 'invoice_fts'),)
+            if fts_table in existing}
+
+# Searches on these tables go through their trigram index (see SCHEMA_OBJECTS);
+# missing when the SQLite build lacks FTS5, in which case LIKE is used throughout
+DATATABLE_FTS_TABLES = load_fts_tables()
+
+# The trigram tokenizer cannot match terms shorter than one trigram
+FTS_MIN_SEARCH_LENGTH = 3
+
+def _like_pattern(term):
+    """Substring LIKE pattern with the user's own %, _ and \\ matched literally"""
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def stream_datatable(table_name, default_order, search=None):
+    """Stream one DataTables page, with paging, search and ordering done in SQL.
+
+    Honours DataTables' server-side params (start, length, search[value] and
+    order[0]); without a length every row is returned, as the client-side
+    tables expect. Rows are streamed one at a time instead of building a list.
+    With ?format=ndjson the rows are sent as newline-delimited JSON, one object
+    per line and no envelope, for exports and scripts that read incrementally.
+
+    Pages ordered by id can also be fetched by keyset: the envelope carries the
+    last_id of the page, and echoing it back as ?last_id= seeks straight to the
+    next page on the primary key instead of skipping `start` rows.
+    """
+    args = request.args
+    draw = args.get('draw', type=int, default=1)
+    start = max(args.get('start', type=int, default=0), 0)
+    length = args.get('length', type=int, default=-1)
+    paged = length >= 0 or start > 0
+    if search is None:
+        search = args.get('search[value]', '')
+    search = search.strip()
+
+    where, params = '', []
+    fts_table = DATATABLE_FTS_TABLES.get(table_name)
+    if fts_table and len(search) >= FTS_MIN_SEARCH_LENGTH:
+        # Quoted as one phrase, which the trigram index treats as a substring
+        where = f" WHERE id IN (SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ?)"
+        params = ['"' + search.replace('"', '""') + '"']
+    elif search:
+        columns = DATATABLE_SEARCH_COLUMNS[table_name]
+        where = ' WHERE (' + ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in columns) + ')'
+        params = [_like_pattern(search)] * len(columns)
+
+    # Only whitelisted column names reach the ORDER BY
+    order = default_order
+    order_column = args.get(f"columns[{args.get('order[0][column]', type=int, default=-1)}][data]")
+    if order_column in table_columns(table_name):
+        direction = 'ASC' if args.get('order[0][dir]') == 'asc' else 'DESC'
+        order = f"{order_column} {direction}, id {direction}"
+
+    page_where, page_params, offset = where, params, start
+    last_id = args.get('last_id', type=int)
+    if last_id is not None and order.split(',')[0] in ('id DESC', 'id ASC'):
+        seek = 'id < ?' if order.startswith('id DESC') else 'id > ?'
+        page_where = f"{where} AND {seek}" if where else f" WHERE {seek}"
+        page_params, offset = params + [last_id], 0
+
+    query = f"SELECT * FROM {table_name}{page_where} ORDER BY {order} LIMIT ? OFFSET ?"
+
+    if args.get('format') == 'ndjson':
+        def generate_ndjson():
+            with db_pool.get() as conn:
+                for row in conn.execute(query, page_params + [length, offset]):
+                    yield orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE)
+
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+    def generate():
+        with db_pool.get() as conn:
+            count = 0
+            page_last_id = None
+            yield b'{"data":['
+            for row in conn.execute(query, page_params + [length, offset]):
+                yield (b',' if count else b'') + orjson.dumps(dict(row))
+                page_last_id = row['id']
+                count += 1
+
+            # An unpaged listing already counted its rows while streaming them
+            filtered = count
+            if paged and search:
+                filtered = conn.execute(f"SELECT COUNT(*) FROM {table_name}{where}", params).fetchone()[0]
+            total = filtered
+            if paged or search:
+                total = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                if not search:
+                    filtered = total
+            yield b'],"draw":%d,"recordsTotal":%d,"recordsFiltered":%d,"last_id":%s}' % (
+                draw, total, filtered, orjson.dumps(page_last_id))
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def calculate_analytics_json():
+    """Build the analytics payload as a single JSON document inside SQLite.
+
+    The stored copy in analytics_cache_table is read on every call: it is one
+    primary-key lookup, and the triggers empty it on any write from any process,
+    so it is never staler than the tables. It is recomputed only when missing.
+    """
+    thirty_days_ago = analytics_window_start()
+    # The nightly scheduler or another worker has usually stored it already
+    with db_pool.get() as conn:
+        cached = read_analytics_cache(conn, thirty_days_ago)
+    if cached is not None:
+        return cached
+    # Storing the payload changes no source table, so it leaves the write
+    # generation that other in-process caches are keyed on alone
+    with db_pool.transaction(bump_generation=False) as conn:
+        return refresh_analytics_cache(conn, thirty_days_ago)
+
 def calculate_analytics():
     """Calculate comprehensive analytics from all database tables"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        analytics = {
-            'summary': {},
-            'counts': {},
-            'daily_sales': [],
-            'monthly_revenue': [],
-            'payment_methods': {},
-            'top_suppliers': [],
-            'top_items': [],
-            'unpaid_invoices': [],
-            'payment_status': []
-        }
-
-        # Basic counts
-        cursor.execute("SELECT COUNT(*) FROM daily_book_closing_table")
-        analytics['counts']['daily_book_count'] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM payments_table")
-        analytics['counts']['payments_count'] = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(DISTINCT invoice_number) FROM invoice_table")
-        analytics['counts']['invoice_count'] = cursor.fetchone()[0]
-
-        # Total revenue from daily book closing
-        cursor.execute("SELECT SUM(total_sales) FROM daily_book_closing_table WHERE total_sales IS NOT NULL")
-        result = cursor.fetchone()[0]
-        analytics['summary']['total_revenue'] = result if result else 0.0
-
-        # Outstanding payments (pending)
-        cursor.execute("SELECT SUM(total_amount) FROM payments_table WHERE payment_status = 'pending'")
-        result = cursor.fetchone()[0]
-        analytics['summary']['total_outstanding'] = result if result else 0.0
-
-        # Daily sales data (last 30 days)
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        cursor.execute("""
-            SELECT closing_date, total_sales
-            FROM daily_book_closing_table
-            WHERE closing_date >= ? AND total_sales IS NOT NULL
-            ORDER BY closing_date DESC LIMIT 30
-        """, (thirty_days_ago,))
-
-        for row in cursor.fetchall():
-            analytics['daily_sales'].append({
-                'date': row[0],
-                'sales': row[1] if row[1] else 0
-            })
-
-        # Monthly revenue
-        cursor.execute("""
-            SELECT strftime('%Y', closing_date) as year,
-                   strftime('%m', closing_date) as month,
-                   SUM(total_sales) as revenue
-            FROM daily_book_closing_table
-            WHERE total_sales IS NOT NULL
-            GROUP BY year, month
-            ORDER BY year DESC, month DESC
-            LIMIT 12
-        """)
-
-        for row in cursor.fetchall():
-            analytics['monthly_revenue'].append({
-                'year': int(row[0]),
-                'month': int(row[1]),
-                'revenue': row[2] if row[2] else 0
-            })
-
-        # Payment methods distribution
-        cursor.execute("""
-            SELECT SUM(cash_amount), SUM(credit_amount), SUM(nets_amount), SUM(nets_qr_amount)
-            FROM daily_book_closing_table
-        """)
-
-        payment_totals = cursor.fetchone()
-        analytics['payment_methods'] = {
-            'cash': payment_totals[0] if payment_totals[0] else 0,
-            'credit': payment_totals[1] if payment_totals[1] else 0,
-            'nets': payment_totals[2] if payment_totals[2] else 0,
-            'nets_qr': payment_totals[3] if payment_totals[3] else 0
-        }
-
-        # Top suppliers by total amount (one entry per invoice)
-        cursor.execute("""
-            SELECT supplier_name,
-                   SUM(total_amount) as total,
-                   COUNT(DISTINCT invoice_number) as invoice_count
-            FROM (
-                SELECT DISTINCT invoice_number, supplier_name, total_amount
-                FROM invoice_table
-                WHERE supplier_name IS NOT NULL
-            ) unique_invoices
-            GROUP BY supplier_name
-            ORDER BY total DESC
-            LIMIT 10
-        """)
-
-        for row in cursor.fetchall():
-            analytics['top_suppliers'].append({
-                'name': row[0],
-                'amount': row[1] if row[1] else 0,
-                'count': row[2]
-            })
-
-        # Top items by quantity (sum actual quantities and their amounts)
-        cursor.execute("""
-            SELECT item_name,
-                   SUM(quantity) as total_qty,
-                   SUM(COALESCE(total_amount_per_item, amount_per_item, 0)) as total_value
-            FROM invoice_table
-            WHERE item_name IS NOT NULL
-            GROUP BY item_name
-            ORDER BY total_qty DESC
-            LIMIT 10
-        """)
-
-        for row in cursor.fetchall():
-            analytics['top_items'].append({
-                'name': row[0],
-                'quantity': row[1] if row[1] else 0,
-                'amount': row[2] if row[2] else 0
-            })
-
-        # Pending invoices (unpaid)
-        cursor.execute("""
-            SELECT invoice_number, supplier_name, total_amount, payment_due_date
-            FROM payments_table
-            WHERE payment_status = 'pending'
-            ORDER BY payment_due_date ASC
-            LIMIT 10
-        """)
-
-        for row in cursor.fetchall():
-            analytics['unpaid_invoices'].append({
-                'invoice_number': row[0],
-                'supplier_name': row[1] if row[1] else 'Unknown',
-                'amount': row[2] if row[2] else 0,
-                'due_date': row[3] if row[3] else 'N/A'
-            })
-
-        # Payment status distribution
-        cursor.execute("""
-            SELECT payment_status, COUNT(*) as count, SUM(total_amount) as amount
-            FROM payments_table
-            GROUP BY payment_status
-        """)
-
-        for row in cursor.fetchall():
-            analytics['payment_status'].append({
-                'status': row[0] if row[0] else 'unknown',
-                'count': row[1],
-                'amount': row[2] if row[2] else 0
-            })
-
-        conn.close()
-        return analytics
+        return orjson.loads(calculate_analytics_json())
 
     except Exception as e:
         print(f"Analytics calculation error: {e}")
@@ -414,6 +920,41 @@ def order_recommendations():
     """Display order recommendations dashboard"""
     return render_template('order_recommendations.html')
 
+def _order_recommendations_query(by_supplier, by_status):
+    query = """
+        SELECT
+            id,
+            supplier_name,
+            recommended_date,
+            total_amount_sgd,
+            status,
+            items_json,
+            notes,
+            created_at,
+            ordered_at,
+            delivered_at,
+            updated_at
+        FROM order_recommendations
+        WHERE 1=1
+    """
+    if by_supplier:
+        query += " AND supplier_name = ?"
+    if by_status:
+        query += " AND status = ?"
+    return query + " ORDER BY recommended_date DESC, created_at DESC"
+
+# Keyed by (filter by supplier, filter by status)
+ORDER_RECOMMENDATIONS_QUERIES = {
+    (by_supplier, by_status): _order_recommendations_query(by_supplier, by_status)
+    for by_supplier in (False, True)
+    for by_status in (False, True)
+}
+
+@lru_cache(maxsize=4096)
+def _parse_items(rec_id, updated_at, items_json):
+    """Parse a recommendation's items_json once per (id, updated_at) revision"""
+    return orjson.loads(items_json) if items_json else []
+
 @app.route('/api/order-recommendations')
 @login_required
 def api_order_recommendations():
@@ -422,84 +963,85 @@ def api_order_recommendations():
         supplier_filter = request.args.get('supplier', 'all')
         status_filter = request.args.get('status', 'all')
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        query = """
-            SELECT
-                id,
-                supplier_name,
-                recommended_date,
-                total_amount_sgd,
-                status,
-                items_json,
-                notes,
-                created_at,
-                ordered_at,
-                delivered_at
-            FROM order_recommendations
-            WHERE 1=1
-        """
-
-        params = []
-
-        if supplier_filter != 'all':
-            query += " AND supplier_name = ?"
-            params.append(supplier_filter)
-
-        if status_filter != 'all':
-            query += " AND status = ?"
-            params.append(status_filter)
-
-        query += " ORDER BY recommended_date DESC, created_at DESC"
-
-        cursor.execute(query, params)
-
-        recommendations = []
-        for row in cursor.fetchall():
-            items = json.loads(row[5]) if row[5] else []
-            recommendations.append({
-                'id': row[0],
-                'supplier_name': row[1],
-                'recommended_date': row[2],
-                'total_amount_sgd': row[3],
-                'status': row[4],
-                'items': items,
-                'items_count': len(items),
-                'notes': row[6],
-                'created_at': row[7],
-                'ordered_at': row[8],
-                'delivered_at': row[9]
-            })
-
-        conn.close()
-        return jsonify({'success': True, 'recommendations': recommendations})
+        # Pick one of the precomputed statements so each filter combination
+        # stays a stable entry in sqlite3's statement cache
+        query = ORDER_RECOMMENDATIONS_QUERIES[(supplier_filter != 'all', status_filter != 'all')]
+        params = [value for value in (supplier_filter, status_filter) if value != 'all']
+
+        def generate():
+            with db_pool.get() as conn:
+                count = 0
+                yield b'{"success":true,"recommendations":['
+                for row in conn.execute(query, params):
+                    items = _parse_items(row[0], row[10], row[5])
+                    yield (b',' if count else b'') + orjson.dumps({
+                        'id': row[0],
+                        'supplier_name': row[1],
+                        'recommended_date': row[2],
+                        'total_amount_sgd': row[3],
+                        'status': row[4],
+                        'items': items,
+                        'items_count': len(items),
+                        'notes': row[6],
+                        'created_at': row[7],
+                        'ordered_at': row[8],
+                        'delivered_at': row[9]
+                    })
+                    count += 1
+                yield b']}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+RECOMMENDATION_SUPPLIERS_QUERY = """
+    SELECT DISTINCT supplier_name
+    FROM order_recommendations
+    ORDER BY supplier_name
+"""
+
+SUPPLIERS_CACHE_SECONDS = 60
+
+@lru_cache(maxsize=1)
+def _cached_recommendation_suppliers(write_generation, time_bucket):
+    with db_pool.get() as conn:
+        return [row[0] for row in conn.execute(RECOMMENDATION_SUPPLIERS_QUERY)]
+
+def recommendation_suppliers():
+    """Supplier list for the filter dropdown, refreshed after app writes or once a minute"""
+    time_bucket = int(time.monotonic() // SUPPLIERS_CACHE_SECONDS)
+    return _cached_recommendation_suppliers(db_pool.write_generation, time_bucket)
+
 @app.route('/api/order-recommendations/suppliers')
 @login_required
 def api_order_recommendations_suppliers():
     """Get list of all suppliers for filter dropdown"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT DISTINCT supplier_name
-            FROM order_recommendations
-            ORDER BY supplier_name
-        """)
-
-        suppliers = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        suppliers = recommendation_suppliers()
 
         return jsonify({'success': True, 'suppliers': suppliers})
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+UPDATE_RECOMMENDATION_STATUS_QUERY = """
+    UPDATE order_recommendations
+    SET status = :status,
+        updated_at = CURRENT_TIMESTAMP,
+        ordered_at = CASE WHEN :status = 'ordered' THEN CURRENT_TIMESTAMP ELSE ordered_at END,
+        delivered_at = CASE WHEN :status = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END
+    WHERE id = :id
+    RETURNING supplier_name
+"""
+
+TOUCH_SUPPLIER_ORDER_PATTERN_QUERY = """
+    UPDATE supplier_order_patterns
+    SET last_order_date = DATE('now'),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE supplier_name = ?
+"""
+
 @app.route('/api/order-recommendations/<int:rec_id>/status', methods=['POST'])
 @login_required
 def api_update_recommendation_status(rec_id):
@@ -511,44 +1053,31 @@ def api_update_recommendation_status(rec_id):
         if not new_status or new_status not in ['pending', 'ordered', 'delivered']:
             return jsonify({'success': False, 'error': 'Invalid status'}), 400
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Update status and timestamps
-        update_query = "UPDATE order_recommendations SET status = ?, updated_at = CURRENT_TIMESTAMP"
-        params = [new_status]
-
-        if new_status == 'ordered':
-            update_query += ", ordered_at = CURRENT_TIMESTAMP"
-        elif new_status == 'delivered':
-            update_query += ", delivered_at = CURRENT_TIMESTAMP"
-
-        update_query += " WHERE id = ?"
-        params.append(rec_id)
-
-        cursor.execute(update_query, params)
-
-        # If status is delivered, update supplier_order_patterns
-        if new_status == 'delivered':
-            cursor.execute("SELECT supplier_name FROM order_recommendations WHERE id = ?", (rec_id,))
-            result = cursor.fetchone()
-            if result:
-                supplier_name = result[0]
-                cursor.execute("""
-                    UPDATE supplier_order_patterns
-                    SET last_order_date = DATE('now'),
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE supplier_name = ?
-                """, (supplier_name,))
+        # Take the write lock up front so both updates land in one transaction
+        with db_pool.transaction() as conn:
+            # Update status and timestamps, getting the supplier back in the same statement
+            result = conn.execute(UPDATE_RECOMMENDATION_STATUS_QUERY,
+                                  {'status': new_status, 'id': rec_id}).fetchone()
 
-        conn.commit()
-        conn.close()
+            # If status is delivered, update supplier_order_patterns
+            if result and new_status == 'delivered':
+                conn.execute(TOUCH_SUPPLIER_ORDER_PATTERN_QUERY, (result[0],))
 
         return jsonify({'success': True, 'message': 'Status updated successfully'})
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Below this many items the NumPy array setup costs more than the Python loop saves
+VECTOR_SUM_MIN_ITEMS = 32
+
+def sum_item_subtotals(items):
+    """Total the item subtotals, reducing in NumPy for long item lists"""
+    if len(items) < VECTOR_SUM_MIN_ITEMS:
+        return sum(item.get('subtotal', 0) for item in items)
+    subtotals = np.fromiter((item.get('subtotal', 0.0) for item in items), dtype=np.float64, count=len(items))
+    return float(subtotals.sum())
+
 @app.route('/api/order-recommendations/<int:rec_id>', methods=['PUT'])
 @login_required
 def api_update_recommendation(rec_id):
@@ -558,21 +1087,20 @@ def api_update_recommendation(rec_id):
         items = data.get('items', [])
 
         # Recalculate total
-        total_amount = sum(item.get('subtotal', 0) for item in items)
+        total_amount = sum_item_subtotals(items)
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with db_pool.writer() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            UPDATE order_recommendations
-            SET items_json = ?,
-                total_amount_sgd = ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (json.dumps(items), round(total_amount, 2), rec_id))
+            cursor.execute("""
+                UPDATE order_recommendations
+                SET items_json = ?,
+                    total_amount_sgd = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (orjson.dumps(items).decode(), round(total_amount, 2), rec_id))
 
-        conn.commit()
-        conn.close()
+            conn.commit()
 
         return jsonify({'success': True, 'message': 'Recommendation updated successfully'})
 
@@ -584,19 +1112,30 @@ def api_update_recommendation(rec_id):
 def api_delete_recommendation(rec_id):
     """Delete an order recommendation"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM order_recommendations WHERE id = ?", (rec_id,))
-
-        conn.commit()
-        conn.close()
+        with db_pool.writer() as conn:
+            conn.execute(DELETE_BY_ID_QUERIES['order_recommendations'], (rec_id,))
+            conn.commit()
 
         return jsonify({'success': True, 'message': 'Recommendation deleted successfully'})
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# The engine stores each week's label as the prefix of notes,
+# e.g. "Week 1 (Nov 01 - Nov 07) - 5 items (Min: SGD 10.0)"
+# Weekly totals are summed from the item subtotals in items_json with json_each,
+# so the summary reflects the stored items rather than the denormalized total
+WEEKLY_RECOMMENDATIONS_SUMMARY_QUERY = """
+    SELECT MIN(substr(r.notes, 1, instr(r.notes, ') - '))) as week_label,
+           COUNT(DISTINCT r.id) as orders_count,
+           ROUND(COALESCE(SUM(json_extract(item.value, '$.subtotal')), 0), 2) as total_value
+    FROM order_recommendations r
+    LEFT JOIN json_each(r.items_json) item
+    WHERE r.id > ?
+    GROUP BY r.recommended_date
+    ORDER BY r.recommended_date
+"""
+
 @app.route('/api/order-recommendations/generate', methods=['POST'])
 @login_required
 def api_generate_recommendations():
@@ -607,23 +1146,20 @@ def api_generate_recommendations():
 
         from order_recommendation_engine import OrderRecommendationEngine
 
+        with db_pool.get() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_recommendations").fetchone()[0]
+
         engine = OrderRecommendationEngine(db_path)
         recommendations = engine.run(target_month=target_month, clear_existing=True)
+        # The engine writes on its own connection, so drop the cached supplier list
+        _cached_recommendation_suppliers.cache_clear()
 
-        # Group by week for summary
-        from collections import defaultdict
-        by_week = defaultdict(list)
-        for rec in recommendations:
-            by_week[rec['recommended_date']].append(rec)
-
-        weeks_summary = []
-        for week_date in sorted(by_week.keys()):
-            week_recs = by_week[week_date]
-            weeks_summary.append({
-                'week_label': week_recs[0]['week_label'] if week_recs else '',
-                'orders_count': len(week_recs),
-                'total_value': sum(r['total_amount_sgd'] for r in week_recs)
-            })
+        # Group the newly written rows by week for the summary
+        with db_pool.get() as conn:
+            weeks_summary = [
+                {'week_label': row[0], 'orders_count': row[1], 'total_value': row[2]}
+                for row in conn.execute(WEEKLY_RECOMMENDATIONS_SUMMARY_QUERY, (last_id,))
+            ]
 
         return jsonify({
             'success': True,
@@ -645,52 +1181,43 @@ def price_changes():
     """Display price changes page - items with >10% price hikes"""
     return render_template('price_changes.html')
 
+def _price_changes_query(reviewed):
+    """Build the price changes query for a reviewed filter (True, False or None for all)"""
+    query = ("SELECT id, item_name, supplier, inventory_price, invoice_price, price_difference,"
+             " percentage_hike, detected_at, reviewed FROM price_changes")
+    if reviewed is not None:
+        query += " WHERE reviewed = %d" % reviewed
+    return query + " ORDER BY percentage_hike DESC"
+
+# Keyed by the raw ?reviewed= value so each filter maps to one stable statement
+PRICE_CHANGES_QUERIES = {
+    'true': _price_changes_query(True),
+    'false': _price_changes_query(False),
+    None: _price_changes_query(None),
+}
+
 @app.route('/api/price-changes')
 @login_required
 def api_price_changes():
     """Get all detected price changes"""
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
         # Get filters
         reviewed = request.args.get('reviewed')  # 'true', 'false', or None for all
 
-        query = "SELECT * FROM price_changes WHERE 1=1"
-        params = []
-
-        if reviewed == 'true':
-            query += " AND reviewed = 1"
-        elif reviewed == 'false':
-            query += " AND reviewed = 0"
-
-        query += " ORDER BY percentage_hike DESC"
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-
-        price_changes_list = []
-        for row in rows:
-            price_changes_list.append({
-                'id': row['id'],
-                'item_name': row['item_name'],
-                'supplier': row['supplier'],
-                'inventory_price': row['inventory_price'],
-                'invoice_price': row['invoice_price'],
-                'price_difference': row['price_difference'],
-                'percentage_hike': row['percentage_hike'],
-                'detected_at': row['detected_at'],
-                'reviewed': bool(row['reviewed'])
-            })
+        query = PRICE_CHANGES_QUERIES.get(reviewed, PRICE_CHANGES_QUERIES[None])
 
-        conn.close()
+        def generate():
+            with db_pool.get() as conn:
+                count = 0
+                yield b'{"success":true,"price_changes":['
+                # The query projects exactly the response columns, so each Row
+                # unpacks in C; only `reviewed` needs converting to a bool
+                for row in conn.execute(query):
+                    yield (b',' if count else b'') + orjson.dumps({**row, 'reviewed': bool(row['reviewed'])})
+                    count += 1
+                yield b'],"count":%d}' % count
 
-        return jsonify({
-            'success': True,
-            'price_changes': price_changes_list,
-            'count': len(price_changes_list)
-        })
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -700,17 +1227,16 @@ def api_price_changes():
 def api_mark_price_change_reviewed(change_id):
     """Mark a price change as reviewed"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        with db_pool.writer() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            UPDATE price_changes
-            SET reviewed = 1
-            WHERE id = ?
-        """, (change_id,))
+            cursor.execute("""
+                UPDATE price_changes
+                SET reviewed = 1
+                WHERE id = ?
+            """, (change_id,))
 
-        conn.commit()
-        conn.close()
+            conn.commit()
 
         return jsonify({'success': True, 'message': 'Marked as reviewed'})
 
@@ -722,12 +1248,9 @@ def api_mark_price_change_reviewed(change_id):
 def api_delete_price_change(change_id):
     """Delete a price change record"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM price_changes WHERE id = ?", (change_id,))
-        conn.commit()
-        conn.close()
+        with db_pool.writer() as conn:
+            conn.execute(DELETE_BY_ID_QUERIES['price_changes'], (change_id,))
+            conn.commit()
 
         return jsonify({'success': True, 'message': 'Deleted successfully'})
 
@@ -767,6 +1290,114 @@ def cash_management():
                          selected_date=selected_date,
                          today=today)
 
+# Columns the cash management range table renders
+CASH_RANGE_QUERY = """
+    SELECT id, entry_date, entry_time,
+           dollar_100_total, dollar_50_total, dollar_10_total, dollar_5_total, dollar_2_total,
+           dollar_1_total, cent_50_total, cent_20_total, cent_10_total, cent_5_total,
+           grand_total, telegram_username
+    FROM cash_denomination_table
+    WHERE entry_date BETWEEN ? AND ?
+    ORDER BY entry_date DESC
+"""
+
+# TOTAL() treats NULL amounts as 0
+CASH_RANGE_SUMMARY_QUERY = """
+    SELECT COUNT(*),
+           TOTAL(grand_total),
+           TOTAL(dollar_100_total) + TOTAL(dollar_50_total) + TOTAL(dollar_10_total) +
+           TOTAL(dollar_5_total) + TOTAL(dollar_2_total),
+           TOTAL(dollar_1_total) + TOTAL(cent_50_total) + TOTAL(cent_20_total) +
+           TOTAL(cent_10_total) + TOTAL(cent_5_total)
+    FROM cash_denomination_table
+    WHERE entry_date BETWEEN ? AND ?
+"""
+
+CASH_DAY_QUERY = "SELECT * FROM cash_denomination_table WHERE entry_date = ?"
+
+CASH_DELETE_RETURNING_QUERY = "DELETE FROM cash_denomination_table WHERE id = ? RETURNING entry_date"
+
+CASH_CACHE_SECONDS = 10
+
+# Ranges with more rows than this are streamed row by row instead of being built and cached in memory
+CASH_STREAM_MIN_ROWS = 500
+
+def cash_range_summary(conn, start_date, end_date):
+    """Entry count and summary block for a date range, aggregated by SQLite"""
+    total_entries, total_amount, bills_total, coins_total = \
+        conn.execute(CASH_RANGE_SUMMARY_QUERY, (start_date, end_date)).fetchone()
+    return total_entries, {
+        'total_amount': total_amount,
+        'bills_total': bills_total,
+        'coins_total': coins_total,
+        'total_entries': total_entries,
+        'start_date': start_date,
+        'end_date': end_date
+    }
+
+def cash_denomination_payload(selected_date, start_date, end_date):
+    """Build the cash denomination response body for a single date or a date range.
+
+    Returns None for a range too large to build in memory; the caller streams it instead.
+    """
+    with db_pool.get() as conn:
+        if start_date and end_date:
+            # Date range query; summary and rows are read in one transaction
+            conn.execute("BEGIN")
+            total_entries, summary = cash_range_summary(conn, start_date, end_date)
+
+            if not total_entries:
+                return {
+                    'success': False,
+                    'message': f'No cash denomination data found for date range {start_date} to {end_date}'
+                }
+            if total_entries > CASH_STREAM_MIN_ROWS:
+                return None
+
+            return {
+                'success': True,
+                'data': [dict(row) for row in conn.execute(CASH_RANGE_QUERY, (start_date, end_date))],
+                'is_range': True,
+                'summary': summary
+            }
+
+        row = conn.execute(CASH_DAY_QUERY, (selected_date,)).fetchone()
+
+    if not row:
+        return {
+            'success': False,
+            'message': f'No cash denomination data found for {selected_date}'
+        }
+
+    return {
+        'success': True,
+        'data': dict(row),
+        'is_range': False
+    }
+
+def stream_cash_range(start_date, end_date):
+    """Stream a large range response, writing the summary first and then one row at a time"""
+    def generate():
+        with db_pool.get() as conn:
+            conn.execute("BEGIN")
+            _, summary = cash_range_summary(conn, start_date, end_date)
+            yield b'{"success":true,"is_range":true,"summary":' + orjson.dumps(summary) + b',"data":['
+            first = True
+            for row in conn.execute(CASH_RANGE_QUERY, (start_date, end_date)):
+                yield (b'' if first else b',') + orjson.dumps(dict(row))
+                first = False
+            yield b']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@lru_cache(maxsize=512)
+def _cached_cash_denomination(write_generation, time_bucket, selected_date, start_date, end_date):
+    payload = cash_denomination_payload(selected_date, start_date, end_date)
+    if payload is None:
+        return None
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return body, hashlib.md5(body).hexdigest()
+
 @app.route('/api/cash-denomination')
 @login_required
 def api_cash_denomination():
@@ -776,93 +1407,53 @@ def api_cash_denomination():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        if start_date and end_date:
-            # Date range query
-            cursor.execute("""
-                SELECT * FROM cash_denomination_table
-                WHERE entry_date BETWEEN ? AND ?
-                ORDER BY entry_date DESC
-            """, (start_date, end_date))
-
-            rows = cursor.fetchall()
-
-            if rows:
-                columns = [desc[0] for desc in cursor.description]
-                data = [dict(zip(columns, row)) for row in rows]
-
-                # Calculate totals for the date range
-                total_grand_total = sum(row.get('grand_total', 0) or 0 for row in data)
-                total_bills = sum((row.get('dollar_100_total', 0) or 0) +
-                                (row.get('dollar_50_total', 0) or 0) +
-                                (row.get('dollar_10_total', 0) or 0) +
-                                (row.get('dollar_5_total', 0) or 0) +
-                                (row.get('dollar_2_total', 0) or 0) for row in data)
-                total_coins = sum((row.get('dollar_1_total', 0) or 0) +
-                                (row.get('cent_50_total', 0) or 0) +
-                                (row.get('cent_20_total', 0) or 0) +
-                                (row.get('cent_10_total', 0) or 0) +
-                                (row.get('cent_5_total', 0) or 0) for row in data)
-
-                conn.close()
-                return jsonify({
-                    'success': True,
-                    'data': data,
-                    'is_range': True,
-                    'summary': {
-                        'total_amount': total_grand_total,
-                        'bills_total': total_bills,
-                        'coins_total': total_coins,
-                        'total_entries': len(data),
-                        'start_date': start_date,
-                        'end_date': end_date
-                    }
-                })
+        try:
+            if start_date and end_date:
+                selected_date = None
+                start_date = date.fromisoformat(start_date).isoformat()
+                end_date = date.fromisoformat(end_date).isoformat()
             else:
-                conn.close()
-                return jsonify({
-                    'success': False,
-                    'message': f'No cash denomination data found for date range {start_date} to {end_date}'
-                })
+                # Single date query (default to today if no date provided)
+                start_date = end_date = None
+                selected_date = date.fromisoformat(selected_date).isoformat() if selected_date else date.today().isoformat()
+        except ValueError:
+            return ojsonify({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}, 400)
+
+        # An inverted range can never match; answer without touching the database
+        if start_date and start_date > end_date:
+            return ojsonify({
+                'success': True,
+                'data': [],
+                'is_range': True,
+                'summary': {
+                    'total_amount': 0.0,
+                    'bills_total': 0.0,
+                    'coins_total': 0.0,
+                    'total_entries': 0,
+                    'start_date': start_date,
+                    'end_date': end_date
+                }
+            })
 
-        else:
-            # Single date query (default to today if no date provided)
-            if not selected_date:
-                selected_date = date.today().strftime('%Y-%m-%d')
+        # Writes from this app bump the pool's write generation; the short time
+        # bucket bounds staleness for entries saved by the Telegram bot
+        time_bucket = int(time.monotonic() // CASH_CACHE_SECONDS)
+        cached = _cached_cash_denomination(db_pool.write_generation, time_bucket,
+                                           selected_date, start_date, end_date)
+        if cached is None:
+            return stream_cash_range(start_date, end_date)
+        body, etag = cached
 
-            cursor.execute("""
-                SELECT * FROM cash_denomination_table
-                WHERE entry_date = ?
-            """, (selected_date,))
-
-            row = cursor.fetchone()
-
-            if row:
-                # Convert row to dictionary
-                columns = [desc[0] for desc in cursor.description]
-                data = dict(zip(columns, row))
-                conn.close()
-
-                return jsonify({
-                    'success': True,
-                    'data': data,
-                    'is_range': False
-                })
-            else:
-                conn.close()
-                return jsonify({
-                    'success': False,
-                    'message': f'No cash denomination data found for {selected_date}'
-                })
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
 
     except Exception as e:
         print(f"Error fetching cash denomination data: {e}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 # Cash Management Delete Routes
 @app.route('/api/cash-denomination/delete/<int:record_id>', methods=['POST'])
@@ -870,131 +1461,112 @@ def api_cash_denomination():
 def delete_cash_denomination(record_id):
     """Delete a cash denomination entry"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Check if record exists first
-        cursor.execute('SELECT * FROM cash_denomination_table WHERE id = ?', (record_id,))
-        record = cursor.fetchone()
+        with db_pool.writer() as conn:
+            # Delete and learn whether the record existed in one statement
+            record = conn.execute(CASH_DELETE_RETURNING_QUERY, (record_id,)).fetchone()
 
-        if not record:
-            conn.close()
-            return jsonify({
-                'success': False,
-                'error': 'Cash denomination record not found'
-            }), 404
+            if not record:
+                return ojsonify({
+                    'success': False,
+                    'error': 'Cash denomination record not found'
+                }, 404)
 
-        # Delete the record
-        cursor.execute('DELETE FROM cash_denomination_table WHERE id = ?', (record_id,))
-        conn.commit()
-        conn.close()
+            conn.commit()
 
-        return jsonify({
+        return ojsonify({
             'success': True,
-            'message': f'Cash denomination record for {record[1]} deleted successfully'
+            'message': f'Cash denomination record for {record["entry_date"]} deleted successfully'
         })
 
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
+
+# Denomination values in the column order used by CASH_UPSERT_QUERY
+CASH_QTY_KEYS = ('dollar_100_qty', 'dollar_50_qty', 'dollar_10_qty', 'dollar_5_qty', 'dollar_2_qty',
+                 'dollar_1_qty', 'cent_50_qty', 'cent_20_qty', 'cent_10_qty', 'cent_5_qty')
+CASH_DENOMS = np.array([100.0, 50.0, 10.0, 5.0, 2.0, 1.0, 0.50, 0.20, 0.10, 0.05], dtype=np.float64)
+CASH_DENOMS.flags.writeable = False
+
+# Relies on the unique index on entry_date: one statement inserts or overwrites the day's count
+CASH_UPSERT_QUERY = """
+    INSERT INTO cash_denomination_table (
+        entry_date, entry_time,
+        dollar_100_qty, dollar_50_qty, dollar_10_qty, dollar_5_qty, dollar_2_qty,
+        dollar_1_qty, cent_50_qty, cent_20_qty, cent_10_qty, cent_5_qty,
+        dollar_100_total, dollar_50_total, dollar_10_total, dollar_5_total, dollar_2_total,
+        dollar_1_total, cent_50_total, cent_20_total, cent_10_total, cent_5_total,
+        grand_total,
+        telegram_username, telegram_user_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(entry_date) DO UPDATE SET
+        entry_time = excluded.entry_time,
+        dollar_100_qty = excluded.dollar_100_qty, dollar_50_qty = excluded.dollar_50_qty,
+        dollar_10_qty = excluded.dollar_10_qty, dollar_5_qty = excluded.dollar_5_qty,
+        dollar_2_qty = excluded.dollar_2_qty, dollar_1_qty = excluded.dollar_1_qty,
+        cent_50_qty = excluded.cent_50_qty, cent_20_qty = excluded.cent_20_qty,
+        cent_10_qty = excluded.cent_10_qty, cent_5_qty = excluded.cent_5_qty,
+        dollar_100_total = excluded.dollar_100_total, dollar_50_total = excluded.dollar_50_total,
+        dollar_10_total = excluded.dollar_10_total, dollar_5_total = excluded.dollar_5_total,
+        dollar_2_total = excluded.dollar_2_total, dollar_1_total = excluded.dollar_1_total,
+        cent_50_total = excluded.cent_50_total, cent_20_total = excluded.cent_20_total,
+        cent_10_total = excluded.cent_10_total, cent_5_total = excluded.cent_5_total,
+        grand_total = excluded.grand_total,
+        telegram_username = excluded.telegram_username,
+        telegram_user_id = excluded.telegram_user_id,
+        updated_at = CURRENT_TIMESTAMP
+"""
 
 @app.route('/api/cash-denomination/save', methods=['POST'])
 @login_required
 def api_save_cash_denomination():
     """Save or update cash denomination data"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return ojsonify({'success': False, 'error': 'Request body must be a JSON object'}, 400)
 
-        # Extract data from request
+        # Extract data from request; entry_date is the upsert key and NOT NULL
         entry_date = data.get('entry_date')
+        try:
+            datetime.strptime(entry_date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return ojsonify({'success': False, 'error': 'entry_date must be a YYYY-MM-DD date'}, 400)
         entry_time = data.get('entry_time', datetime.now().strftime('%H:%M:%S'))
 
-        # Get quantities
-        dollar_100_qty = int(data.get('dollar_100_qty', 0))
-        dollar_50_qty = int(data.get('dollar_50_qty', 0))
-        dollar_10_qty = int(data.get('dollar_10_qty', 0))
-        dollar_5_qty = int(data.get('dollar_5_qty', 0))
-        dollar_2_qty = int(data.get('dollar_2_qty', 0))
-        dollar_1_qty = int(data.get('dollar_1_qty', 0))
-        cent_50_qty = int(data.get('cent_50_qty', 0))
-        cent_20_qty = int(data.get('cent_20_qty', 0))
-        cent_10_qty = int(data.get('cent_10_qty', 0))
-        cent_5_qty = int(data.get('cent_5_qty', 0))
-
-        # Calculate totals
-        dollar_100_total = dollar_100_qty * 100.0
-        dollar_50_total = dollar_50_qty * 50.0
-        dollar_10_total = dollar_10_qty * 10.0
-        dollar_5_total = dollar_5_qty * 5.0
-        dollar_2_total = dollar_2_qty * 2.0
-        dollar_1_total = dollar_1_qty * 1.0
-        cent_50_total = cent_50_qty * 0.50
-        cent_20_total = cent_20_qty * 0.20
-        cent_10_total = cent_10_qty * 0.10
-        cent_5_total = cent_5_qty * 0.05
-
-        grand_total = (dollar_100_total + dollar_50_total + dollar_10_total +
-                      dollar_5_total + dollar_2_total + dollar_1_total +
-                      cent_50_total + cent_20_total + cent_10_total + cent_5_total)
-
-        # Get current user info
-        telegram_username = session.get('username', 'web_user')
-        telegram_user_id = session.get('user_id', 'web')
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        # Get quantities; a bad value is the client's mistake, not a server error
+        try:
+            qtys = np.array([int(data.get(key) or 0) for key in CASH_QTY_KEYS], dtype=np.int64)
+        except (TypeError, ValueError) as e:
+            return ojsonify({'success': False, 'error': f'Invalid quantity: {e}'}, 400)
+        if (qtys < 0).any():
+            return ojsonify({'success': False, 'error': 'Quantities cannot be negative'}, 400)
 
-        # Check if entry exists for this date
-        cursor.execute("SELECT id FROM cash_denomination_table WHERE entry_date = ?", (entry_date,))
-        existing = cursor.fetchone()
+        # Per-denomination totals
+        totals = qtys * CASH_DENOMS
+        grand_total = float(totals.sum())
 
-        if existing:
-            # Update existing entry
-            cursor.execute("""
-                UPDATE cash_denomination_table
-                SET entry_time = ?,
-                    dollar_100_qty = ?, dollar_50_qty = ?, dollar_10_qty = ?, dollar_5_qty = ?, dollar_2_qty = ?,
-                    dollar_1_qty = ?, cent_50_qty = ?, cent_20_qty = ?, cent_10_qty = ?, cent_5_qty = ?,
-                    dollar_100_total = ?, dollar_50_total = ?, dollar_10_total = ?, dollar_5_total = ?, dollar_2_total = ?,
-                    dollar_1_total = ?, cent_50_total = ?, cent_20_total = ?, cent_10_total = ?, cent_5_total = ?,
-                    grand_total = ?,
-                    telegram_username = ?, telegram_user_id = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE entry_date = ?
-            """, (entry_time,
-                  dollar_100_qty, dollar_50_qty, dollar_10_qty, dollar_5_qty, dollar_2_qty,
-                  dollar_1_qty, cent_50_qty, cent_20_qty, cent_10_qty, cent_5_qty,
-                  dollar_100_total, dollar_50_total, dollar_10_total, dollar_5_total, dollar_2_total,
-                  dollar_1_total, cent_50_total, cent_20_total, cent_10_total, cent_5_total,
-                  grand_total,
-                  telegram_username, telegram_user_id,
-                  entry_date))
-        else:
-            # Insert new entry
-            cursor.execute("""
-                INSERT INTO cash_denomination_table (
-                    entry_date, entry_time,
-                    dollar_100_qty, dollar_50_qty, dollar_10_qty, dollar_5_qty, dollar_2_qty,
-                    dollar_1_qty, cent_50_qty, cent_20_qty, cent_10_qty, cent_5_qty,
-                    dollar_100_total, dollar_50_total, dollar_10_total, dollar_5_total, dollar_2_total,
-                    dollar_1_total, cent_50_total, cent_20_total, cent_10_total, cent_5_total,
-                    grand_total,
-                    telegram_username, telegram_user_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (entry_date, entry_time,
-                  dollar_100_qty, dollar_50_qty, dollar_10_qty, dollar_5_qty, dollar_2_qty,
-                  dollar_1_qty, cent_50_qty, cent_20_qty, cent_10_qty, cent_5_qty,
-                  dollar_100_total, dollar_50_total, dollar_10_total, dollar_5_total, dollar_2_total,
-                  dollar_1_total, cent_50_total, cent_20_total, cent_10_total, cent_5_total,
-                  grand_total,
-                  telegram_username, telegram_user_id))
-
-        conn.commit()
-        conn.close()
+        # Get current user info
+        telegram_username, telegram_user_id = g.user
 
-        return jsonify({
+        # The upsert is keyed on entry_date, so a retried save is harmless. Success
+        # is only reported once the write has committed
+        try:
+            with db_pool.transaction() as conn:
+                conn.execute(CASH_UPSERT_QUERY,
+                             (entry_date, entry_time) + tuple(qtys.tolist()) + tuple(totals.tolist()) +
+                             (grand_total, telegram_username, telegram_user_id))
+        except sqlite3.IntegrityError as e:
+            return ojsonify({'success': False, 'error': f'Invalid cash denomination: {e}'}, 400)
+        except sqlite3.OperationalError as e:
+            # busy_timeout ran out waiting for another process's write
+            if 'locked' not in str(e):
+                raise
+            return ojsonify({'success': False, 'error': 'Database is busy, please retry'}, 503)
+
+        return ojsonify({
             'success': True,
             'message': 'Cash denomination saved successfully',
             'grand_total': round(grand_total, 2)
@@ -1002,42 +1574,52 @@ def api_save_cash_denomination():
 
     except Exception as e:
         print(f"Error saving cash denomination: {e}")
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': str(e)
-        }), 500
-
-@app.route('/api/bulk-delete/cash-denomination', methods=['POST'])
-@login_required
-def bulk_delete_cash_denomination():
-    """Bulk delete cash denomination entries"""
+        }, 500)
+
+# Bulk deletes bind all ids as one JSON array expanded by json_each, so each
+# table has a single prepared statement whatever the number of ids and there
+# is no bound-variable limit to stay under
+BULK_DELETE_QUERIES = {
+    table_name: f"DELETE FROM {table_name} WHERE id IN (SELECT value FROM json_each(?))"
+    for table_name in ('cash_denomination_table', 'daily_book_closing_table', 'payments_table', 'invoice_table')
+}
+
+def _bulk_delete(table_name, ids):
+    """Delete the given integer ids in one statement and transaction; returns the number of rows removed"""
+    with db_pool.transaction() as conn:
+        return conn.execute(BULK_DELETE_QUERIES[table_name], (orjson.dumps(ids).decode(),)).rowcount
+
+def bulk_delete_response(table_name):
+    """Shared body of the bulk delete endpoints: validate the posted ids and delete them"""
     try:
-        data = request.get_json()
-        ids = data.get('ids', [])
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'ids' not in data:
+            return ojsonify({'success': False, 'error': 'No IDs provided'}, 400)
 
-        if not ids:
-            return jsonify({'success': False, 'error': 'No record IDs provided'}), 400
+        if not isinstance(data['ids'], list):
+            return ojsonify({'success': False, 'error': 'IDs must be a list'}, 400)
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        if not data['ids']:
+            return ojsonify({'success': False, 'error': 'Empty ID list'}, 400)
 
-        # Build the SQL for bulk delete
-        placeholders = ','.join(['?' for _ in ids])
-        query = f'DELETE FROM cash_denomination_table WHERE id IN ({placeholders})'
-
-        cursor.execute(query, ids)
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        try:
+            ids = sorted({int(record_id) for record_id in data['ids']})
+        except (TypeError, ValueError):
+            return ojsonify({'success': False, 'error': 'Record IDs must be integers'}, 400)
 
-        return jsonify({
-            'success': True,
-            'message': f'Successfully deleted {deleted_count} cash denomination record(s)',
-            'deleted_count': deleted_count
-        })
+        return ojsonify({'success': True, 'deleted_count': _bulk_delete(table_name, ids)})
 
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
+
+@app.route('/api/bulk-delete/cash-denomination', methods=['POST'])
+@login_required
+def bulk_delete_cash_denomination():
+    """Bulk delete cash denomination entries"""
+    return bulk_delete_response('cash_denomination_table')
 
 # ===========================================================================
 # ===========================================================================
@@ -1045,383 +1627,225 @@ def bulk_delete_cash_denomination():
 # ===========================================================================
 # TODO: Implement new order recommendation logic here
 
-# CRUD Routes for Daily Book Closing
-@app.route('/daily-book-closing/add', methods=['GET', 'POST'])
-@login_required
-def add_daily_book_closing():
-    if request.method == 'POST':
-        try:
-            # Get form data
-            data = request.form.to_dict()
-            
-            # Convert empty strings to None and handle numeric fields
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key in ['total_sales', 'average_sales_per_transaction', 'nets_qr_amount',
-                           'cash_amount', 'credit_amount', 'nets_amount', 'total_settlement',
-                           'expected_cash_balance', 'voided_amount']:
-                    processed_data[key] = float(value) if value else None
-                elif key in ['number_of_transactions', 'voided_transactions']:
-                    processed_data[key] = int(value) if value else None
-                else:
-                    processed_data[key] = value
-            
-            # Add processed_at timestamp
-            processed_data['processed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            
-            # Build INSERT query
-            columns = list(processed_data.keys())
-            placeholders = ', '.join(['?' for _ in columns])
-            query = f"INSERT INTO daily_book_closing_table ({', '.join(columns)}) VALUES ({placeholders})"
-            
-            if execute_direct_query(query, list(processed_data.values())):
-                flash('Daily book closing record added successfully!', 'success')
-                return redirect(url_for('daily_book_closing'))
-            else:
-                flash('Error adding record', 'error')
-                
-        except Exception as e:
-            flash(f'Error adding record: {str(e)}', 'error')
-    
-    return render_template('add_daily_book_closing.html')
+# CRUD routes. Daily book closing, payments and invoices share one add, edit and
+# delete implementation, parameterised by table and registered below
+def make_add_handler(table_name, float_columns, int_columns, label, list_endpoint, template, stamp_processed_at=False):
+    """Add view for a table: a single form post, or a JSON list of rows for bulk imports"""
+    noun = label.lower()
 
-@app.route('/daily-book-closing/edit/<int:record_id>', methods=['GET', 'POST'])
-@login_required
-def edit_daily_book_closing(record_id):
-    record = get_record_by_id('daily_book_closing_table', record_id)
-    if not record:
-        flash('Record not found', 'error')
-        return redirect(url_for('daily_book_closing'))
-    
-    if request.method == 'POST':
-        try:
-            data = request.form.to_dict()
-            
-            # Process data similar to add function
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key in ['total_sales', 'average_sales_per_transaction', 'nets_qr_amount',
-                           'cash_amount', 'credit_amount', 'nets_amount', 'total_settlement',
-                           'expected_cash_balance', 'voided_amount']:
-                    processed_data[key] = float(value) if value else None
-                elif key in ['number_of_transactions', 'voided_transactions']:
-                    processed_data[key] = int(value) if value else None
+    @login_required
+    def add_record():
+        if request.method == 'POST':
+            try:
+                # Convert empty strings to None and handle numeric fields. Numeric text bound
+                # to a column with numeric affinity is stored as a number by SQLite, so only
+                # columns lacking that affinity keep a Python-side cast
+                numeric = numeric_affinity_columns(table_name)
+                rows = [_coerce_row(data, float_columns - numeric, int_columns - numeric)
+                        for data in submitted_rows()]
+
+                if stamp_processed_at:
+                    processed_at = datetime.now().isoformat(sep=' ', timespec='microseconds')
+                    for row in rows:
+                        row['processed_at'] = processed_at
+
+                inserted = insert_rows(table_name, rows)
+                if request.is_json:
+                    return jsonify({'success': bool(inserted), 'inserted': inserted or 0}), 200 if inserted else 400
+                if inserted:
+                    flash(f'{label} record added successfully!', 'success')
+                    return redirect(url_for(list_endpoint))
                 else:
-                    processed_data[key] = value
-            
-            # Build UPDATE query
-            set_clause = ', '.join([f"{key} = ?" for key in processed_data.keys()])
-            query = f"UPDATE daily_book_closing_table SET {set_clause} WHERE id = ?"
-            params = list(processed_data.values()) + [record_id]
-            
-            if execute_direct_query(query, params):
-                flash('Record updated successfully!', 'success')
-                return redirect(url_for('daily_book_closing'))
-            else:
-                flash('Error updating record', 'error')
-                
-        except Exception as e:
-            flash(f'Error updating record: {str(e)}', 'error')
-    
-    return render_template('edit_daily_book_closing.html', record=record)
+                    flash(f'Error adding {noun} record', 'error')
 
-@app.route('/daily-book-closing/delete/<int:record_id>', methods=['POST'])
-@login_required
-def delete_daily_book_closing(record_id):
-    try:
-        query = "DELETE FROM daily_book_closing_table WHERE id = ?"
-        if execute_direct_query(query, (record_id,)):
-            flash('Record deleted successfully!', 'success')
-        else:
-            flash('Error deleting record', 'error')
-    except Exception as e:
-        flash(f'Error deleting record: {str(e)}', 'error')
-    
-    return redirect(url_for('daily_book_closing'))
+            except sqlite3.IntegrityError as e:
+                # e.g. a daily book closing for a date that already has one
+                if request.is_json:
+                    return jsonify({'success': False, 'error': f'Conflicts with an existing record: {e}'}), 409
+                flash(f'{label} record conflicts with an existing one ({e}); edit that record instead', 'error')
+            except Exception as e:
+                if request.is_json:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                flash(f'Error adding {noun} record: {str(e)}', 'error')
 
-@app.route('/daily-book-closing/update', methods=['POST'])
-@login_required
-def update_daily_book_closing():
-    """Process daily book closing images from Google Drive using dailyBookClosing.py"""
-    try:
-        import subprocess
-        import os
-
-        # Run the dailyBookClosing processing script
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dailyBookClosing.py')
-        result = subprocess.run(['python3', script_path],
-                              capture_output=True, text=True, timeout=1800)  # 30 minutes timeout
-
-        if result.returncode == 0:
-            # Parse output for summary information
-            output_lines = result.stdout.strip().split('\n')
-
-            # Look for processing summary
-            summary_found = False
-            for line in output_lines:
-                if 'Successfully Processed:' in line and 'Total Date Groups Found:' in line:
-                    summary_found = True
-                    break
+        return render_template(template)
 
-            if summary_found:
-                # Extract key metrics from the output
-                total_groups = 0
-                success_count = 0
-
-                for line in output_lines:
-                    if 'Successfully Processed:' in line:
-                        try:
-                            success_count = int(line.split(':')[1].strip())
-                        except:
-                            pass
-                    elif 'Total Date Groups Found:' in line:
-                        try:
-                            total_groups = int(line.split(':')[1].strip())
-                        except:
-                            pass
-
-                if total_groups > 0:
-                    flash(f'Daily book closing update completed! Processed {success_count} out of {total_groups} date groups successfully.', 'success')
-                else:
-                    flash('Daily book closing update completed! No new images found to process.', 'info')
-            else:
-                flash('Daily book closing update completed successfully!', 'success')
-        else:
-            error_msg = result.stderr if result.stderr else "Unknown error occurred"
-            flash(f'Daily book closing update failed: {error_msg}', 'error')
+    return add_record
 
-    except subprocess.TimeoutExpired:
-        flash('Daily book closing update timed out. The process may still be running in the background.', 'warning')
-    except Exception as e:
-        flash(f'Error updating daily book closing: {str(e)}', 'error')
+def make_edit_handler(table_name, float_columns, int_columns, label, list_endpoint, template):
+    """Edit view for one record of a table"""
+    noun = label.lower()
 
-    return redirect(url_for('daily_book_closing'))
+    @login_required
+    def edit_record(record_id):
+        record = get_record_by_id(table_name, record_id)
+        if not record:
+            flash(f'{label} record not found', 'error')
+            return redirect(url_for(list_endpoint))
 
-# CRUD Routes for Payments
-@app.route('/payments/add', methods=['GET', 'POST'])
-@login_required
-def add_payment():
-    if request.method == 'POST':
-        try:
-            data = request.form.to_dict()
-            
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key == 'total_amount':
-                    processed_data[key] = float(value) if value else None
+        if request.method == 'POST':
+            try:
+                numeric = numeric_affinity_columns(table_name)
+                processed_data = _coerce_row(request.form.to_dict(), float_columns - numeric, int_columns - numeric)
+
+                if update_row(table_name, record_id, processed_data):
+                    flash(f'{label} record updated successfully!', 'success')
+                    return redirect(url_for(list_endpoint))
                 else:
-                    processed_data[key] = value
-            
-            columns = list(processed_data.keys())
-            placeholders = ', '.join(['?' for _ in columns])
-            query = f"INSERT INTO payments_table ({', '.join(columns)}) VALUES ({placeholders})"
-            
-            if execute_direct_query(query, list(processed_data.values())):
-                flash('Payment record added successfully!', 'success')
-                return redirect(url_for('payments'))
-            else:
-                flash('Error adding payment record', 'error')
-                
-        except Exception as e:
-            flash(f'Error adding payment: {str(e)}', 'error')
-    
-    return render_template('add_payment.html')
+                    flash(f'Error updating {noun} record', 'error')
 
-@app.route('/payments/edit/<int:record_id>', methods=['GET', 'POST'])
-@login_required
-def edit_payment(record_id):
-    record = get_record_by_id('payments_table', record_id)
-    if not record:
-        flash('Payment record not found', 'error')
-        return redirect(url_for('payments'))
-    
-    if request.method == 'POST':
+            except sqlite3.IntegrityError as e:
+                flash(f'{label} record conflicts with an existing one ({e})', 'error')
+            except Exception as e:
+                flash(f'Error updating {noun} record: {str(e)}', 'error')
+
+        return render_template(template, record=record)
+
+    return edit_record
+
+def make_delete_handler(table_name, label, list_endpoint):
+    """Delete view for one record of a table"""
+    noun = label.lower()
+
+    @login_required
+    def delete_record(record_id):
         try:
-            data = request.form.to_dict()
-            
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key == 'total_amount':
-                    processed_data[key] = float(value) if value else None
-                else:
-                    processed_data[key] = value
-            
-            set_clause = ', '.join([f"{key} = ?" for key in processed_data.keys()])
-            query = f"UPDATE payments_table SET {set_clause} WHERE id = ?"
-            params = list(processed_data.values()) + [record_id]
-            
-            if execute_direct_query(query, params):
-                flash('Payment updated successfully!', 'success')
-                return redirect(url_for('payments'))
+            if execute_direct_query(DELETE_BY_ID_QUERIES[table_name], (record_id,)):
+                flash(f'{label} record deleted successfully!', 'success')
             else:
-                flash('Error updating payment', 'error')
-                
+                flash(f'Error deleting {noun} record', 'error')
         except Exception as e:
-            flash(f'Error updating payment: {str(e)}', 'error')
-    
-    return render_template('edit_payment.html', record=record)
+            flash(f'Error deleting {noun} record: {str(e)}', 'error')
+
+        return redirect(url_for(list_endpoint))
+
+    return delete_record
+
+# (URL prefix, endpoint/template suffix, table, float columns, int columns, label, list endpoint)
+CRUD_TABLES = (
+    ('/daily-book-closing', 'daily_book_closing', 'daily_book_closing_table',
+     DBC_FLOAT_COLUMNS, DBC_INT_COLUMNS, 'Daily book closing', 'daily_book_closing'),
+    ('/payments', 'payment', 'payments_table',
+     PAYMENT_FLOAT_COLUMNS, frozenset(), 'Payment', 'payments'),
+    ('/invoices', 'invoice', 'invoice_table',
+     INVOICE_FLOAT_COLUMNS, INVOICE_INT_COLUMNS, 'Invoice', 'invoices'),
+)
+
+for url_prefix, name, table_name, float_columns, int_columns, label, list_endpoint in CRUD_TABLES:
+    app.add_url_rule(f'{url_prefix}/add', f'add_{name}',
+                     make_add_handler(table_name, float_columns, int_columns, label, list_endpoint, f'add_{name}.html',
+                                      stamp_processed_at=table_name == 'daily_book_closing_table'),
+                     methods=['GET', 'POST'])
+    app.add_url_rule(f'{url_prefix}/edit/<int:record_id>', f'edit_{name}',
+                     make_edit_handler(table_name, float_columns, int_columns, label, list_endpoint, f'edit_{name}.html'),
+                     methods=['GET', 'POST'])
+    app.add_url_rule(f'{url_prefix}/delete/<int:record_id>', f'delete_{name}',
+                     make_delete_handler(table_name, label, list_endpoint),
+                     methods=['POST'])
 
-@app.route('/payments/delete/<int:record_id>', methods=['POST'])
+@app.route('/daily-book-closing/update', methods=['POST'])
 @login_required
-def delete_payment(record_id):
-    try:
-        query = "DELETE FROM payments_table WHERE id = ?"
-        if execute_direct_query(query, (record_id,)):
-            flash('Payment deleted successfully!', 'success')
-        else:
-            flash('Error deleting payment', 'error')
-    except Exception as e:
-        flash(f'Error deleting payment: {str(e)}', 'error')
-    
-    return redirect(url_for('payments'))
+def update_daily_book_closing():
+    """Process daily book closing images from Google Drive using dailyBookClosing.py, off the request thread"""
+    return queue_update_job('daily_book_closing', daily_book_closing_job, 'Daily book closing update',
+                            'Error updating daily book closing', 'daily_book_closing')
 
 @app.route('/payments/update', methods=['POST'])
 @login_required
 def update_payments():
-    """Process UOB payment emails and update payment statuses"""
-    try:
-        import subprocess
-        import os
-
-        # Run the UOB payment processing script
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uob_payment_emails.py')
-        result = subprocess.run(['python3', script_path],
-                              capture_output=True, text=True, timeout=120)
-
-        if result.returncode == 0:
-            # Extract summary from output
-            output_lines = result.stdout.strip().split('\n')
-            summary_line = [line for line in output_lines if '🎯 Summary:' in line]
-
-            if summary_line:
-                summary = summary_line[-1].replace('🎯 Summary: ', '')
-                flash(f'Payment update completed! {summary}', 'success')
-            else:
-                flash('Payment update completed successfully!', 'success')
-        else:
-            flash(f'Payment update failed: {result.stderr}', 'error')
+    """Process UOB payment emails and update payment statuses, off the request thread"""
+    return queue_update_job('payments', payments_job, 'Payment update', 'Error updating payments', 'payments')
+
+# Google Drive uploads
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+DRIVE_TOKEN_FILE = 'token.json'
+DRIVE_CREDENTIALS_FILE = 'credentials.json'
+INVOICES_FOLDER_ID = "162d4TyRYwvGXdeVYkZTAY6AMpc50sJtf"
+DAILY_BOOK_CLOSING_FOLDER_ID = "1sxtFv5mgGSafgWQ3UufW1D2c9f4xE7-Y"
+
+_drive_service_lock = threading.Lock()
+_drive_service = None
+_drive_creds = None
+_drive_token_mtime = 0
+
+def get_drive_service():
+    """Drive v3 client shared across requests.
+
+    Credentials are loaded and the client built once; both are redone only when
+    token.json changes on disk or the cached credentials stop being valid.
+    Returns None when there is no token and no OAuth client secrets to create one.
+    """
+    global _drive_service, _drive_creds, _drive_token_mtime
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
+    with _drive_service_lock:
+        token_mtime = os.path.getmtime(DRIVE_TOKEN_FILE) if os.path.exists(DRIVE_TOKEN_FILE) else 0
+        if _drive_service is not None and token_mtime == _drive_token_mtime and _drive_creds.valid:
+            return _drive_service
 
-    except subprocess.TimeoutExpired:
-        flash('Payment update timed out. Please try again.', 'error')
-    except Exception as e:
-        flash(f'Error updating payments: {str(e)}', 'error')
-
-    return redirect(url_for('payments'))
+        creds = None
+        if token_mtime:
+            creds = Credentials.from_authorized_user_file(DRIVE_TOKEN_FILE, DRIVE_SCOPES)
 
-# CRUD Routes for Invoices
-@app.route('/invoices/add', methods=['GET', 'POST'])
-@login_required
-def add_invoice():
-    if request.method == 'POST':
-        try:
-            data = request.form.to_dict()
-            
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key in ['quantity', 'items_per_carton']:
-                    processed_data[key] = int(value) if value else None
-                elif key in ['total_amount', 'unit_price', 'unit_price_item', 'amount_per_item', 
-                           'gst_amount', 'total_amount_per_item']:
-                    processed_data[key] = float(value) if value else None
-                else:
-                    processed_data[key] = value
-            
-            columns = list(processed_data.keys())
-            placeholders = ', '.join(['?' for _ in columns])
-            query = f"INSERT INTO invoice_table ({', '.join(columns)}) VALUES ({placeholders})"
-            
-            if execute_direct_query(query, list(processed_data.values())):
-                flash('Invoice record added successfully!', 'success')
-                return redirect(url_for('invoices'))
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
             else:
-                flash('Error adding invoice record', 'error')
-                
-        except Exception as e:
-            flash(f'Error adding invoice: {str(e)}', 'error')
-    
-    return render_template('add_invoice.html')
+                if not os.path.exists(DRIVE_CREDENTIALS_FILE):
+                    return None
+                flow = InstalledAppFlow.from_client_secrets_file(DRIVE_CREDENTIALS_FILE, DRIVE_SCOPES)
+                creds = flow.run_local_server(port=0)
 
-@app.route('/invoices/edit/<int:record_id>', methods=['GET', 'POST'])
-@login_required
-def edit_invoice(record_id):
-    record = get_record_by_id('invoice_table', record_id)
-    if not record:
-        flash('Invoice record not found', 'error')
-        return redirect(url_for('invoices'))
-    
-    if request.method == 'POST':
-        try:
-            data = request.form.to_dict()
-            
-            processed_data = {}
-            for key, value in data.items():
-                if value == '':
-                    processed_data[key] = None
-                elif key in ['quantity', 'items_per_carton']:
-                    processed_data[key] = int(value) if value else None
-                elif key in ['total_amount', 'unit_price', 'unit_price_item', 'amount_per_item', 
-                           'gst_amount', 'total_amount_per_item']:
-                    processed_data[key] = float(value) if value else None
-                else:
-                    processed_data[key] = value
-            
-            set_clause = ', '.join([f"{key} = ?" for key in processed_data.keys()])
-            query = f"UPDATE invoice_table SET {set_clause} WHERE id = ?"
-            params = list(processed_data.values()) + [record_id]
-            
-            if execute_direct_query(query, params):
-                flash('Invoice updated successfully!', 'success')
-                return redirect(url_for('invoices'))
-            else:
-                flash('Error updating invoice', 'error')
-                
-        except Exception as e:
-            flash(f'Error updating invoice: {str(e)}', 'error')
-    
-    return render_template('edit_invoice.html', record=record)
+            with open(DRIVE_TOKEN_FILE, 'w') as token:
+                token.write(creds.to_json())
+            token_mtime = os.path.getmtime(DRIVE_TOKEN_FILE)
+
+        # The bundled discovery document is used, so building needs no HTTP round-trip
+        _drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        _drive_creds = creds
+        _drive_token_mtime = token_mtime
+        return _drive_service
+
+# Drive handles roughly ten concurrent uploads per user
+DRIVE_UPLOAD_WORKERS = 8
+
+def _upload_one(service, stream, filename, folder_id):
+    """Upload one image on its own HTTP connection, since httplib2 objects are not thread-safe"""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import MediaIoBaseUpload
+
+    # Straight from the request's spooled stream, no temp file
+    stream.seek(0)
+    media = MediaIoBaseUpload(stream, mimetype='image/jpeg', resumable=True, chunksize=1024 * 1024)
+    uploaded_file = service.files().create(
+        body={'name': filename, 'parents': [folder_id]},
+        media_body=media,
+        fields='id, name'
+    ).execute(http=AuthorizedHttp(_drive_creds, http=httplib2.Http()))
+    return uploaded_file.get('name')
+
+def upload_images_to_drive(service, files, prefix, folder_id):
+    """Upload the selected files to a Drive folder concurrently; returns the created file names"""
+    timestamp = int(time.time())
+    named = [(file, f"{prefix}_{timestamp}_{number}.jpg")
+             for number, file in enumerate((file for file in files if file.filename != ''), 1)]
+    if not named:
+        return []
 
-@app.route('/invoices/delete/<int:record_id>', methods=['POST'])
-@login_required
-def delete_invoice(record_id):
-    try:
-        query = "DELETE FROM invoice_table WHERE id = ?"
-        if execute_direct_query(query, (record_id,)):
-            flash('Invoice deleted successfully!', 'success')
-        else:
-            flash('Error deleting invoice', 'error')
-    except Exception as e:
-        flash(f'Error deleting invoice: {str(e)}', 'error')
-    
-    return redirect(url_for('invoices'))
+    with ThreadPoolExecutor(max_workers=min(DRIVE_UPLOAD_WORKERS, len(named))) as executor:
+        futures = [executor.submit(_upload_one, service, file.stream, filename, folder_id)
+                   for file, filename in named]
+        return [future.result() for future in as_completed(futures)]
 
 @app.route('/api/upload-invoices', methods=['POST'])
 @login_required
 def api_upload_invoices():
     """Upload invoice images to Google Drive"""
     try:
-        from google.oauth2.credentials import Credentials
-        from google.auth.transport.requests import Request
-        from google_auth_oauthlib.flow import InstalledAppFlow
-        from googleapiclient.discovery import build
-        from googleapiclient.http import MediaFileUpload
-        import tempfile
-        import time
-
-        SCOPES = ['https://www.googleapis.com/auth/drive']
-        INVOICES_FOLDER_ID = "162d4TyRYwvGXdeVYkZTAY6AMpc50sJtf"
-        TOKEN_FILE = 'token.json'
-        CREDENTIALS_FILE = 'credentials.json'
-
         # Check if files were uploaded
         if 'files' not in request.files:
             return jsonify({'success': False, 'error': 'No files provided'}), 400
@@ -1430,87 +1854,28 @@ def api_upload_invoices():
         if len(files) == 0:
             return jsonify({'success': False, 'error': 'No files selected'}), 400
 
-        # Authenticate with Google Drive
-        creds = None
-        if os.path.exists(TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists(CREDENTIALS_FILE):
-                    return jsonify({'success': False, 'error': 'Google Drive credentials not found'}), 500
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-
-        service = build('drive', 'v3', credentials=creds)
+        service = get_drive_service()
+        if service is None:
+            return jsonify({'success': False, 'error': 'Google Drive credentials not found'}), 500
 
         # Upload files
-        uploaded_count = 0
-        uploaded_files = []
+        uploaded_files = upload_images_to_drive(service, files, 'invoice', INVOICES_FOLDER_ID)
+        uploaded_count = len(uploaded_files)
 
-        for file in files:
-            if file.filename == '':
-                continue
-
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                file.save(temp_file.name)
-                temp_file_path = temp_file.name
-
-            try:
-                # Generate filename with timestamp
-                timestamp = int(time.time())
-                filename = f"invoice_{timestamp}_{uploaded_count + 1}.jpg"
-
-                # Upload to Google Drive
-                file_metadata = {
-                    'name': filename,
-                    'parents': [INVOICES_FOLDER_ID]
-                }
-                media = MediaFileUpload(temp_file_path, mimetype='image/jpeg', resumable=True)
-                uploaded_file = service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id, name'
-                ).execute()
-
-                uploaded_files.append(uploaded_file.get('name'))
-                uploaded_count += 1
-
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-
-        # After successful upload, automatically trigger processing
-        import subprocess
-        processing_started = False
-        processing_error = None
-
-        try:
-            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stockSentinel.py')
-            # Run in background without waiting for completion
-            subprocess.Popen(['python3', script_path],
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE)
-            processing_started = True
-            print(f"Invoice processing started automatically after upload")
-        except Exception as proc_error:
-            print(f"Error starting invoice processing: {proc_error}")
-            processing_error = str(proc_error)
+        # After successful upload, automatically trigger processing on the update
+        # pool. If a run is already in flight, one more pass is queued after it
+        # rather than a second scan competing for the same Drive folder and database
+        job_id, _ = start_update_job('invoices', invoices_job, 'Error updating invoices', rerun_if_running=True)
+        remember_update_job(job_id)
 
         return jsonify({
             'success': True,
             'message': f'Successfully uploaded {uploaded_count} file(s)',
             'uploaded_count': uploaded_count,
             'uploaded_files': uploaded_files,
-            'processing_started': processing_started,
-            'processing_error': processing_error
+            'processing_started': True,
+            'processing_error': None,
+            'job_id': job_id
         })
 
     except Exception as e:
@@ -1522,19 +1887,6 @@ def api_upload_invoices():
 def api_upload_dailybookclosing():
     """Upload daily book closing images to Google Drive"""
     try:
-        from google.oauth2.credentials import Credentials
-        from google.auth.transport.requests import Request
-        from google_auth_oauthlib.flow import InstalledAppFlow
-        from googleapiclient.discovery import build
-        from googleapiclient.http import MediaFileUpload
-        import tempfile
-        import time
-
-        SCOPES = ['https://www.googleapis.com/auth/drive']
-        DAILY_BOOK_CLOSING_FOLDER_ID = "1sxtFv5mgGSafgWQ3UufW1D2c9f4xE7-Y"
-        TOKEN_FILE = 'token.json'
-        CREDENTIALS_FILE = 'credentials.json'
-
         # Check if files were uploaded
         if 'files' not in request.files:
             return jsonify({'success': False, 'error': 'No files provided'}), 400
@@ -1543,87 +1895,28 @@ def api_upload_dailybookclosing():
         if len(files) == 0:
             return jsonify({'success': False, 'error': 'No files selected'}), 400
 
-        # Authenticate with Google Drive
-        creds = None
-        if os.path.exists(TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists(CREDENTIALS_FILE):
-                    return jsonify({'success': False, 'error': 'Google Drive credentials not found'}), 500
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-
-        service = build('drive', 'v3', credentials=creds)
+        service = get_drive_service()
+        if service is None:
+            return jsonify({'success': False, 'error': 'Google Drive credentials not found'}), 500
 
         # Upload files
-        uploaded_count = 0
-        uploaded_files = []
+        uploaded_files = upload_images_to_drive(service, files, 'dailybook', DAILY_BOOK_CLOSING_FOLDER_ID)
+        uploaded_count = len(uploaded_files)
 
-        for file in files:
-            if file.filename == '':
-                continue
-
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                file.save(temp_file.name)
-                temp_file_path = temp_file.name
-
-            try:
-                # Generate filename with timestamp
-                timestamp = int(time.time())
-                filename = f"dailybook_{timestamp}_{uploaded_count + 1}.jpg"
-
-                # Upload to Google Drive
-                file_metadata = {
-                    'name': filename,
-                    'parents': [DAILY_BOOK_CLOSING_FOLDER_ID]
-                }
-                media = MediaFileUpload(temp_file_path, mimetype='image/jpeg', resumable=True)
-                uploaded_file = service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id, name'
-                ).execute()
-
-                uploaded_files.append(uploaded_file.get('name'))
-                uploaded_count += 1
-
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-
-        # After successful upload, automatically trigger processing
-        import subprocess
-        processing_started = False
-        processing_error = None
-
-        try:
-            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dailyBookClosing.py')
-            # Run in background without waiting for completion
-            subprocess.Popen(['python3', script_path],
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE)
-            processing_started = True
-            print(f"Daily book closing processing started automatically after upload")
-        except Exception as proc_error:
-            print(f"Error starting daily book closing processing: {proc_error}")
-            processing_error = str(proc_error)
+        # After successful upload, automatically trigger processing on the update
+        # pool. If a run is already in flight, one more pass is queued after it
+        # rather than a second scan competing for the same Drive folder and database
+        job_id, _ = start_update_job('daily_book_closing', daily_book_closing_job, 'Error updating daily book closing', rerun_if_running=True)
+        remember_update_job(job_id)
 
         return jsonify({
             'success': True,
             'message': f'Successfully uploaded {uploaded_count} file(s)',
             'uploaded_count': uploaded_count,
             'uploaded_files': uploaded_files,
-            'processing_started': processing_started,
-            'processing_error': processing_error
+            'processing_started': True,
+            'processing_error': None,
+            'job_id': job_id
         })
 
     except Exception as e:
@@ -1633,61 +1926,17 @@ def api_upload_dailybookclosing():
 @app.route('/invoices/update', methods=['POST'])
 @login_required
 def update_invoices():
-    """Process invoice images from Google Drive using stockSentinel.py"""
-    try:
-        import subprocess
-        import os
-
-        # Run the stockSentinel processing script
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stockSentinel.py')
-        result = subprocess.run(['python3', script_path],
-                              capture_output=True, text=True, timeout=1800)  # 30 minutes timeout
-
-        if result.returncode == 0:
-            # Parse output for summary information
-            output_lines = result.stdout.strip().split('\n')
-
-            # Look for processing summary
-            summary_found = False
-            for line in output_lines:
-                if 'Successfully Processed:' in line and 'Total Images Found:' in line:
-                    # Extract numbers from summary
-                    summary_found = True
-                    break
-
-            if summary_found:
-                # Extract key metrics from the output
-                total_processed = 0
-                success_count = 0
-
-                for line in output_lines:
-                    if '✅ Successfully Processed:' in line:
-                        try:
-                            success_count = int(line.split(':')[1].strip())
-                        except:
-                            pass
-                    elif '📂 Total Images Found:' in line:
-                        try:
-                            total_processed = int(line.split(':')[1].strip())
-                        except:
-                            pass
-
-                if total_processed > 0:
-                    flash(f'Invoice update completed! Processed {success_count} out of {total_processed} invoices successfully.', 'success')
-                else:
-                    flash('Invoice update completed! No new invoices found to process.', 'info')
-            else:
-                flash('Invoice update completed successfully!', 'success')
-        else:
-            error_msg = result.stderr if result.stderr else "Unknown error occurred"
-            flash(f'Invoice update failed: {error_msg}', 'error')
+    """Process invoice images from Google Drive using stockSentinel.py, off the request thread"""
+    return queue_update_job('invoices', invoices_job, 'Invoice update', 'Error updating invoices', 'invoices')
 
-    except subprocess.TimeoutExpired:
-        flash('Invoice update timed out. The process may still be running in the background.', 'warning')
-    except Exception as e:
-        flash(f'Error updating invoices: {str(e)}', 'error')
-
-    return redirect(url_for('invoices'))
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    """Status of a background update job: queued, running, finished or failed"""
+    entry = get_update_jobs([job_id]).get(job_id)
+    if entry is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **entry})
 
 # Inventory CRUD routes removed - to be implemented later
 
@@ -1696,28 +1945,9 @@ def update_invoices():
 @login_required
 def api_daily_book_closing():
     try:
-        # Get data sorted by closing_date DESC (latest first)
-        # Use DATE() function to properly sort text dates in YYYY-MM-DD format
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM daily_book_closing_table ORDER BY DATE(closing_date) DESC, id DESC")
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-        conn.close()
-
-        data = []
-        for row in rows:
-            row_dict = {}
-            for i, value in enumerate(row):
-                row_dict[columns[i]] = value
-            data.append(row_dict)
-
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        # Get data sorted by closing_date DESC (latest first). Dates are zero-padded
+        # YYYY-MM-DD text, so plain text order is calendar order and idx_dbc_closing_date applies
+        return stream_datatable('daily_book_closing_table', 'closing_date DESC, id DESC')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1725,13 +1955,7 @@ def api_daily_book_closing():
 @login_required
 def api_payments():
     try:
-        data = get_direct_data('payments_table')
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        return stream_datatable('payments_table', 'id DESC')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1739,40 +1963,18 @@ def api_payments():
 @login_required
 def api_invoices():
     try:
-        data = get_direct_data('invoice_table')
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        return stream_datatable('invoice_table', 'id DESC')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Inventory API endpoint removed - to be implemented later
 
-# Search endpoints (existing)
+# Search endpoints; same SQL filtering as the DataTables search box, driven by ?q=
 @app.route('/api/search/daily-book-closing')
 @login_required
 def search_daily_book_closing():
     try:
-        search_term = request.args.get('q', '').strip().lower()
-        data = get_direct_data('daily_book_closing_table')
-        
-        if search_term:
-            filtered_data = []
-            for record in data:
-                if (search_term in str(record.get('closing_date', '')).lower() or
-                    search_term in str(record.get('cash_outs', '')).lower()):
-                    filtered_data.append(record)
-            data = filtered_data
-        
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        return stream_datatable('daily_book_closing_table', 'closing_date DESC, id DESC', search=request.args.get('q', ''))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1780,24 +1982,7 @@ def search_daily_book_closing():
 @login_required
 def search_payments():
     try:
-        search_term = request.args.get('q', '').strip().lower()
-        data = get_direct_data('payments_table')
-        
-        if search_term:
-            filtered_data = []
-            for record in data:
-                if (search_term in str(record.get('supplier_name', '')).lower() or
-                    search_term in str(record.get('invoice_number', '')).lower() or
-                    search_term in str(record.get('payment_status', '')).lower()):
-                    filtered_data.append(record)
-            data = filtered_data
-        
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        return stream_datatable('payments_table', 'id DESC', search=request.args.get('q', ''))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1805,24 +1990,7 @@ def search_payments():
 @login_required
 def search_invoices():
     try:
-        search_term = request.args.get('q', '').strip().lower()
-        data = get_direct_data('invoice_table')
-        
-        if search_term:
-            filtered_data = []
-            for record in data:
-                if (search_term in str(record.get('supplier_name', '')).lower() or
-                    search_term in str(record.get('item_name', '')).lower() or
-                    search_term in str(record.get('invoice_number', '')).lower()):
-                    filtered_data.append(record)
-            data = filtered_data
-        
-        return jsonify({
-            'draw': request.args.get('draw', type=int, default=1),
-            'recordsTotal': len(data),
-            'recordsFiltered': len(data),
-            'data': data
-        })
+        return stream_datatable('invoice_table', 'id DESC', search=request.args.get('q', ''))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1831,10 +1999,9 @@ def search_invoices():
 @login_required
 def api_analytics():
     try:
-        analytics = calculate_analytics()
-        return jsonify(analytics)
+        return Response(calculate_analytics_json(), mimetype='application/json')
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 # Inventory search API removed - to be implemented later
 
@@ -1842,78 +2009,31 @@ def api_analytics():
 @app.route('/api/bulk-delete/invoices', methods=['POST'])
 @login_required
 def bulk_delete_invoices():
-    try:
-        data = request.get_json()
-        if not data or 'ids' not in data:
-            return jsonify({'success': False, 'error': 'No IDs provided'}), 400
-
-        ids = data['ids']
-        if not ids:
-            return jsonify({'success': False, 'error': 'Empty ID list'}), 400
-
-        # Create placeholders for SQL IN clause
-        placeholders = ', '.join(['?' for _ in ids])
-        query = f"DELETE FROM invoice_table WHERE id IN ({placeholders})"
-
-        if execute_direct_query(query, ids):
-            return jsonify({'success': True, 'deleted_count': len(ids)})
-        else:
-            return jsonify({'success': False, 'error': 'Database error'}), 500
-
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return bulk_delete_response('invoice_table')
 
 # Bulk delete inventory endpoint removed - to be implemented later
 
 @app.route('/api/bulk-delete/payments', methods=['POST'])
 @login_required
 def bulk_delete_payments():
-    try:
-        data = request.get_json()
-        if not data or 'ids' not in data:
-            return jsonify({'success': False, 'error': 'No IDs provided'}), 400
-
-        ids = data['ids']
-        if not ids:
-            return jsonify({'success': False, 'error': 'Empty ID list'}), 400
-
-        # Create placeholders for SQL IN clause
-        placeholders = ', '.join(['?' for _ in ids])
-        query = f"DELETE FROM payments_table WHERE id IN ({placeholders})"
-
-        if execute_direct_query(query, ids):
-            return jsonify({'success': True, 'deleted_count': len(ids)})
-        else:
-            return jsonify({'success': False, 'error': 'Database error'}), 500
-
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return bulk_delete_response('payments_table')
 
 @app.route('/api/bulk-delete/daily-book-closing', methods=['POST'])
 @login_required
 def bulk_delete_daily_book_closing():
-    try:
-        data = request.get_json()
-        if not data or 'ids' not in data:
-            return jsonify({'success': False, 'error': 'No IDs provided'}), 400
-
-        ids = data['ids']
-        if not ids:
-            return jsonify({'success': False, 'error': 'Empty ID list'}), 400
-
-        # Create placeholders for SQL IN clause
-        placeholders = ', '.join(['?' for _ in ids])
-        query = f"DELETE FROM daily_book_closing_table WHERE id IN ({placeholders})"
-
-        if execute_direct_query(query, ids):
-            return jsonify({'success': True, 'deleted_count': len(ids)})
-        else:
-            return jsonify({'success': False, 'error': 'Database error'}), 500
-
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return bulk_delete_response('daily_book_closing_table')
 
 # Debug routes (existing)
+def approximate_row_count(conn, table_name):
+    """Row estimate from ANALYZE stats when present, else the highest rowid, avoiding a COUNT(*) scan"""
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table_name,)).fetchone()
+        if row:
+            return int(row[0].split()[0])
+    except sqlite3.OperationalError:
+        pass  # no sqlite_stat1 until ANALYZE has been run
+    return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+
 @app.route('/debug-db')
 @login_required
 def debug_db():
@@ -1925,34 +2045,29 @@ def debug_db():
         if os.path.exists(db_path):
             result['db_size'] = os.path.getsize(db_path)
         
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        result['tables_found'] = [table[0] for table in tables]
-        
-        for table_name in ['daily_book_closing_table', 'payments_table', 'invoice_table']:
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-                count = cursor.fetchone()[0]
-                result[f'{table_name}_count'] = count
-                
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = cursor.fetchall()
-                result[f'{table_name}_columns'] = [col[1] for col in columns]
-                
-                sample_data = get_direct_data(table_name)
-                result[f'{table_name}_sample'] = sample_data[:2]
-                
-            except Exception as e:
-                result[f'{table_name}_error'] = str(e)
-        
-        conn.close()
-        return jsonify(result)
+        with db_pool.get() as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+            result['tables_found'] = [table[0] for table in tables]
+
+            # Table names come from the DEBUG_TABLES whitelist, never from the request
+            for table_name in DEBUG_TABLES:
+                if table_name not in result['tables_found']:
+                    result[f'{table_name}_error'] = 'table not found'
+                    continue
+                try:
+                    result[f'{table_name}_approx_count'] = approximate_row_count(conn, table_name)
+                    result[f'{table_name}_columns'] = table_columns(table_name)
+
+                    sample = conn.execute(f"SELECT * FROM {table_name} ORDER BY id DESC LIMIT 2")
+                    result[f'{table_name}_sample'] = [dict(row) for row in sample]
+
+                except Exception as e:
+                    result[f'{table_name}_error'] = str(e)
+
+        return ojsonify(result)
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}, 500)
 
 if __name__ == '__main__':
     print(f"Database path: {db_path}")
@@ -16,16 +16,24 @@ Usage:
 """
 
 import schedule
-import time
 import sys
 import logging
 import argparse
+import importlib.util
+import os
+import select
 import signal
-import pytz
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from pathlib import Path
 import subprocess
 
+import db_pool
+from analytics_cache import ensure_analytics_cache, refresh_analytics_cache
+
+# Longest single sleep between scheduler checks
+MAX_SLEEP_SECONDS = 3600
+
 # Setup logging
 log_dir = Path(__file__).parent / "logs"
 log_dir.mkdir(exist_ok=True)
@@ -44,49 +52,114 @@ class AutomatedScheduler:
     def __init__(self):
         self.base_dir = Path(__file__).parent
         self.updater_script = self.base_dir / 'daily_auto_updater.py'
-        self.ist_timezone = pytz.timezone('Asia/Kolkata')
+        self.ist_timezone = ZoneInfo('Asia/Kolkata')
         self.running = True
 
         # Verify the updater script exists
         if not self.updater_script.exists():
             logger.error(f"❌ Updater script not found: {self.updater_script}")
             sys.exit(1)
-
-        # Setup signal handlers for graceful shutdown
+        self._updater = self._load_updater()
+
+        # Setup signal handlers for graceful shutdown. The wakeup fd gets a byte
+        # on every signal, which ends the select() in _sleep straight away
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        signal.set_wakeup_fd(self._wakeup_w)
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
+        self.daily_job = None
+        self._cached_next_run_ist = None
+
+    def _load_updater(self):
+        """Import the updater once so nightly runs skip interpreter startup"""
+        try:
+            spec = importlib.util.spec_from_file_location('daily_auto_updater', self.updater_script)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+        except ImportError as e:
+            logger.warning(f"⚠️  Could not import updater ({e}); falling back to a subprocess")
+            return None
 
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         logger.info(f"🛑 Received signal {signum}. Shutting down scheduler...")
         self.running = False
 
+    def _sleep(self, seconds):
+        """Sleep for up to seconds, returning early when a signal arrives"""
+        readable, _, _ = select.select([self._wakeup_r], [], [], seconds)
+        if readable:
+            try:
+                os.read(self._wakeup_r, 512)
+            except BlockingIOError:
+                pass
+
+    def _next_run_ist(self):
+        """Next daily update time in IST, or None before it is scheduled.
+
+        schedule keeps next_run as naive local time, which astimezone() reads as
+        such. The result only changes when the daily job runs, so it is cached
+        until run_daily_updates clears it.
+        """
+        if self._cached_next_run_ist is None and self.daily_job is not None and self.daily_job.next_run:
+            self._cached_next_run_ist = self.daily_job.next_run.astimezone(self.ist_timezone)
+        return self._cached_next_run_ist
+
+    def _log_status(self):
+        """Hourly status line with the time left until the daily updates"""
+        next_run_ist = self._next_run_ist()
+        if next_run_ist:
+            current_ist = self.get_ist_time()
+            hours_until = (next_run_ist - current_ist).total_seconds() / 3600
+            logger.info(f"⏳ Status: {current_ist.strftime('%H:%M IST')} - Next run in {hours_until:.1f} hours")
+
     def get_ist_time(self):
         """Get current time in IST"""
         return datetime.now(self.ist_timezone)
 
     def run_daily_updates(self):
         """Execute the daily updates"""
+        self._cached_next_run_ist = None
         try:
             current_time = self.get_ist_time()
             logger.info(f"🕚 Triggered daily updates at {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
-            # Run the daily auto updater script
-            result = subprocess.run(
-                ['python3', str(self.updater_script)],
-                cwd=str(self.base_dir),
-                capture_output=False,  # Let it show output directly
-                text=True
-            )
-
-            if result.returncode == 0:
+            if self._updater is not None:
+                success = self._updater.run()
+            else:
+                # Run the daily auto updater script
+                result = subprocess.run(
+                    ['python3', str(self.updater_script)],
+                    cwd=str(self.base_dir),
+                    capture_output=False,  # Let it show output directly
+                    text=True
+                )
+                success = result.returncode == 0
+
+            if success:
                 logger.info("✅ Daily updates completed successfully!")
             else:
-                logger.error(f"❌ Daily updates failed with exit code: {result.returncode}")
+                logger.error("❌ Daily updates failed")
 
         except Exception as e:
             logger.error(f"💥 Error running daily updates: {str(e)}")
 
+        # Even after a partial failure, some tables may have changed
+        self.refresh_analytics()
+
+    def refresh_analytics(self):
+        """Precompute the dashboard analytics so the first page load after the updates is a cache hit"""
+        try:
+            with db_pool.transaction() as conn:
+                ensure_analytics_cache(conn)
+                refresh_analytics_cache(conn)
+            logger.info("📊 Dashboard analytics cache refreshed")
+        except Exception as e:
+            logger.error(f"❌ Error refreshing analytics cache: {str(e)}")
+
     def start_scheduler(self):
         """Start the automated scheduler"""
         logger.info("="*80)
@@ -98,13 +171,13 @@ class AutomatedScheduler:
         logger.info(f"⏰ Scheduled to run daily at: 23:00 IST (11:00 PM)")
 
         # Schedule daily updates at 11:00 PM IST
-        schedule.every().day.at("23:00").do(self.run_daily_updates)
+        self.daily_job = schedule.every().day.at("23:00").do(self.run_daily_updates)
+        # Log status every hour
+        schedule.every().hour.at(":00").do(self._log_status)
 
         # Calculate next run time
-        next_run = schedule.next_run()
-        if next_run:
-            # Convert to IST for display
-            next_run_ist = next_run.replace(tzinfo=pytz.UTC).astimezone(self.ist_timezone)
+        next_run_ist = self._next_run_ist()
+        if next_run_ist:
             logger.info(f"📅 Next scheduled run: {next_run_ist.strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
         logger.info("🔄 Scheduler started. Waiting for scheduled time...")
@@ -114,22 +187,13 @@ class AutomatedScheduler:
         # Main scheduler loop
         try:
             while self.running:
-                schedule.run_pending()
-
-                # Log status every hour
-                current_minute = datetime.now().minute
-                current_second = datetime.now().second
-
-                if current_minute == 0 and current_second < 10:
-                    current_ist = self.get_ist_time()
-                    next_run = schedule.next_run()
-                    if next_run:
-                        next_run_ist = next_run.replace(tzinfo=pytz.UTC).astimezone(self.ist_timezone)
-                        time_until_next = next_run_ist - current_ist
-                        hours_until = time_until_next.total_seconds() / 3600
-                        logger.info(f"⏳ Status: {current_ist.strftime('%H:%M IST')} - Next run in {hours_until:.1f} hours")
-
-                time.sleep(10)  # Check every 10 seconds
+                # Sleep until the next job is due instead of polling
+                idle = schedule.idle_seconds()
+                if idle is None:
+                    idle = 60
+                self._sleep(min(max(idle, 0), MAX_SLEEP_SECONDS))
+                if self.running:
+                    schedule.run_pending()
 
         except KeyboardInterrupt:
             logger.info("⏹️  Scheduler interrupted by user")
@@ -5,35 +5,93 @@ Fetches daily book closing images from Google Drive and processes them using Vis
 """
 
 import os
-import time
+import argparse
 import base64
 import mimetypes
 import json
+import re
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from typing import Set, List, Dict, Optional
 from io import BytesIO
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Google Drive imports
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 # Vision OCR imports
 from PIL import Image
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from db_pool import DB_PATH, open_sqlite_connection
+
 # Load environment variables
 load_dotenv(override=True)
 
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 
+# Credentials, tokens and download folders live next to this script, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Images of one closing date are sent to the OCR API concurrently
+OCR_MAX_WORKERS = 8
+
+# Drive downloads are streamed to disk in chunks of this size
+DRIVE_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Local files cleanup_local_images treats as downloaded images (str.endswith takes a tuple)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
+
+# Concurrent Drive downloads, kept under Drive's ~10 requests/second per user
+DRIVE_DOWNLOAD_WORKERS = 8
+
+# Connect and read timeouts (seconds) for one Drive download
+DRIVE_DOWNLOAD_TIMEOUT = (5, 60)
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+# Markdown code fences the model sometimes wraps its JSON in
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$', re.MULTILINE)
+
+# Dates in image file names, in order of preference
+_DATE_PATTERNS = [
+    re.compile(r'(\d{4}-\d{2}-\d{2})'),  # YYYY-MM-DD
+    re.compile(r'(\d{4}_\d{2}_\d{2})'),  # YYYY_MM_DD
+    re.compile(r'(\d{2}-\d{2}-\d{4})'),  # DD-MM-YYYY
+]
+# Drive createdTime is RFC 3339 (e.g. 2024-05-01T08:30:00.000Z); its first 10 chars are the date
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# Screenshots larger than this (longest side, in pixels) are downscaled before upload
+OCR_MAX_IMAGE_SIDE = 1600
+OCR_JPEG_QUALITY = 85
+
+# Connect and read timeouts (seconds) for one OCR call
+OCR_TIMEOUT = (5, 120)
+
+# Shared keep-alive connections to the Together AI API. OCR calls are paid POSTs,
+# so only failures where the request was not processed are retried: connection
+# errors and 429/5xx answers. A read timeout is never re-sent
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=OCR_MAX_WORKERS,
+    max_retries=Retry(total=3, connect=3, read=0, other=0, backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False),
+))
+
 # =============================================================================
 # DAILY BOOK CLOSING MODELS AND DATABASE SETUP
 # =============================================================================
@@ -97,21 +155,54 @@ class DailyBookClosingTable(Base):
     # Metadata
     processed_at = Column(DateTime, default=datetime.now)
 
-# Create DB connection
-engine = create_engine("sqlite:///dailydelights.db")
+# Create DB connection; connections get the shared WAL tuning pragmas from db_pool
+engine = create_engine(f"sqlite:///{DB_PATH}", creator=open_sqlite_connection, pool_pre_ping=True)
 Base.metadata.create_all(engine)
 
-Session = sessionmaker(bind=engine)
-session = Session()
+def ensure_dbc_unique_date() -> bool:
+    """
+    Create the one-row-per-closing-date index that save_daily_closing_to_db upserts on
+    
+    Returns:
+        bool: False when duplicate closing dates already exist, so the index cannot be created
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_dbc_date ON daily_book_closing_table(closing_date)"
+            ))
+        return True
+    except IntegrityError:
+        with engine.connect() as conn:
+            duplicates = conn.execute(text(
+                "SELECT closing_date FROM daily_book_closing_table GROUP BY closing_date HAVING COUNT(*) > 1"
+            )).scalars().all()
+        print("=" * 70)
+        print(f"WARNING: daily_book_closing_table has duplicate closing dates: {', '.join(map(str, duplicates))}")
+        print("Saves update the newest row of each date until the duplicates are removed")
+        print("=" * 70)
+        return False
+
+DBC_UNIQUE_DATE = ensure_dbc_unique_date()
+
+# Short-lived sessions per save: this module also runs inside the web app's worker threads
+Session = sessionmaker(bind=engine, expire_on_commit=False)
 
 # =============================================================================
 # VISION OCR FUNCTIONS
 # =============================================================================
 
 def encode_image(image_path: str) -> str:
-    """Convert image file to base64 string"""
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    """Convert image file to base64 JPEG string, downscaling large screenshots first"""
+    with Image.open(image_path) as img:
+        if max(img.size) <= OCR_MAX_IMAGE_SIDE and img.format == "JPEG":
+            with open(image_path, "rb") as f:
+                return base64.b64encode(f.read()).decode("ascii")
+
+        img.thumbnail((OCR_MAX_IMAGE_SIDE, OCR_MAX_IMAGE_SIDE))
+        buffer = BytesIO()
+        img.convert("RGB").save(buffer, "JPEG", quality=OCR_JPEG_QUALITY)
+    return base64.b64encode(buffer.getbuffer()).decode("ascii")
 
 def is_remote_file(file_path: str) -> bool:
     """Check if file path is a URL"""
@@ -175,7 +266,7 @@ def ocr_daily_closing(file_path: str, model: str, api_key: str = TOGETHER_API_KE
     )
 
     # Make request to Together AI
-    response = requests.post(
+    response = http_session.post(
         "https://api.together.xyz/v1/chat/completions",
         headers={"Authorization": f"Bearer {api_key}"},
         json={
@@ -194,6 +285,7 @@ def ocr_daily_closing(file_path: str, model: str, api_key: str = TOGETHER_API_KE
                 "schema": DailyBookClosingResponse.model_json_schema(),
             }
         },
+        timeout=OCR_TIMEOUT,
         verify=False
     )
 
@@ -203,6 +295,35 @@ def ocr_daily_closing(file_path: str, model: str, api_key: str = TOGETHER_API_KE
     data = response.json()
     return data["choices"][0]["message"]["content"]
 
+def ocr_batch(paths: List[str], model: str) -> List:
+    """
+    Run OCR on several images concurrently, keeping the order of paths.
+    Each result is the JSON content, or the exception raised for that image.
+    """
+    def ocr_one(path):
+        try:
+            return ocr_daily_closing(path, model=model)
+        except Exception as e:
+            return e
+
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(OCR_MAX_WORKERS, len(paths))) as executor:
+        return list(executor.map(ocr_one, paths))
+
+# Single-value fields of a daily closing; cash_outs is merged separately
+MERGED_FIELDS = (
+    'closing_date', 'total_sales', 'number_of_transactions', 'average_sales_per_transaction',
+    'nets_qr_amount', 'cash_amount', 'credit_amount', 'nets_amount', 'total_settlement',
+    'expected_cash_balance', 'voided_transactions', 'voided_amount',
+)
+
+def _as_list(value) -> list:
+    """Wrap a single value in a list; None and empty values become an empty list"""
+    if not value:
+        return []
+    return value if isinstance(value, list) else [value]
+
 def merge_daily_closing_data(json_outputs: List[str]) -> Dict:
     """
     Merge multiple JSON outputs from different images into a single daily closing record
@@ -213,74 +334,83 @@ def merge_daily_closing_data(json_outputs: List[str]) -> Dict:
     Returns:
         Dict: Merged daily closing data
     """
-    merged_data = {
-        "closing_date": None,
-        "total_sales": None,
-        "number_of_transactions": None,
-        "average_sales_per_transaction": None,
-        "nets_qr_amount": None,
-        "cash_amount": None,
-        "credit_amount": None,
-        "nets_amount": None,
-        "total_settlement": None,
-        "expected_cash_balance": None,
-        "cash_outs": [],
-        "voided_transactions": None,
-        "voided_amount": None
-    }
-    
     print(f"Merging {len(json_outputs)} JSON outputs...")
     
+    blobs = []
     for i, json_string in enumerate(json_outputs, 1):
         try:
             # Clean the JSON string
-            cleaned_json = json_string.strip()
-            if cleaned_json.startswith('```json'):
-                cleaned_json = cleaned_json.replace('```json', '').replace('```', '').strip()
-            elif cleaned_json.startswith('```'):
-                cleaned_json = cleaned_json.replace('```', '').strip()
+            cleaned_json = _FENCE_RE.sub('', json_string.strip())
             
             # Parse JSON
-            data = json.loads(cleaned_json)
-            daily_closing = data.get('daily_closing', {})
-            
-            print(f"Processing JSON {i}: {json.dumps(daily_closing, indent=2)[:200]}...")
-            
-            # Merge each field - use the first non-null value found
-            for key, value in daily_closing.items():
-                if key == 'cash_outs' and value:
-                    # For cash_outs, extend the list
-                    if isinstance(value, list):
-                        merged_data['cash_outs'].extend(value)
-                    else:
-                        merged_data['cash_outs'].append(value)
-                elif value is not None and merged_data.get(key) is None:
-                    merged_data[key] = value
+            daily_closing = orjson.loads(cleaned_json).get('daily_closing') or {}
+            blobs.append(daily_closing)
+            
+            print(f"Processing JSON {i}: closing_date={daily_closing.get('closing_date')}, {len(daily_closing)} fields")
             
         except Exception as e:
             print(f"Error processing JSON {i}: {e}")
             continue
     
-    # Clean up cash_outs - remove duplicates and keep only valid numbers
-    if merged_data['cash_outs']:
-        cash_outs_clean = []
-        for amount in merged_data['cash_outs']:
-            if isinstance(amount, (int, float)) and amount > 0:
-                cash_outs_clean.append(float(amount))
-        merged_data['cash_outs'] = cash_outs_clean if cash_outs_clean else None
-    else:
-        merged_data['cash_outs'] = None
-    
-    print(f"Merged data: {json.dumps(merged_data, indent=2)}")
+    # Use the first non-null value found for each field
+    merged_data = {
+        key: next((blob[key] for blob in blobs if blob.get(key) is not None), None)
+        for key in MERGED_FIELDS
+    }
+    
+    # cash_outs are collected from every image, keeping only valid amounts. Repeats
+    # are kept: two payouts of the same amount on one day are two cash outs
+    cash_outs = [
+        float(amount)
+        for blob in blobs
+        for amount in _as_list(blob.get('cash_outs'))
+        if isinstance(amount, (int, float)) and amount > 0
+    ]
+    merged_data['cash_outs'] = cash_outs or None
+    
+    filled = sum(value is not None for value in merged_data.values())
+    print(f"Merged data: closing_date={merged_data.get('closing_date')}, {filled}/{len(merged_data)} fields set")
     return merged_data
 
-def save_daily_closing_to_db(merged_data: Dict, session):
+DBC_UPSERT_COLUMNS = (
+    'total_sales', 'number_of_transactions', 'average_sales_per_transaction',
+    'nets_qr_amount', 'cash_amount', 'credit_amount', 'nets_amount', 'total_settlement',
+    'expected_cash_balance', 'cash_outs', 'voided_transactions', 'voided_amount',
+)
+
+# Insert the day's closing, or fill in the existing row keeping values the new data lacks
+DBC_UPSERT_SQL = text(
+    "INSERT INTO daily_book_closing_table (closing_date, {cols}, processed_at) "
+    "VALUES (:closing_date, {params}, :processed_at) "
+    "ON CONFLICT(closing_date) DO UPDATE SET {updates}, processed_at = excluded.processed_at".format(
+        cols=", ".join(DBC_UPSERT_COLUMNS),
+        params=", ".join(f":{col}" for col in DBC_UPSERT_COLUMNS),
+        updates=", ".join(f"{col} = COALESCE(excluded.{col}, {col})" for col in DBC_UPSERT_COLUMNS),
+    )
+)
+
+# Without ux_dbc_date there is no conflict target, so the day's newest row is
+# updated in place and a new row inserted only when the date has none
+DBC_UPDATE_LATEST_SQL = text(
+    "UPDATE daily_book_closing_table SET {updates}, processed_at = :processed_at "
+    "WHERE id = (SELECT MAX(id) FROM daily_book_closing_table WHERE closing_date = :closing_date)".format(
+        updates=", ".join(f"{col} = COALESCE(:{col}, {col})" for col in DBC_UPSERT_COLUMNS),
+    )
+)
+DBC_INSERT_SQL = text(
+    "INSERT INTO daily_book_closing_table (closing_date, {cols}, processed_at) "
+    "VALUES (:closing_date, {params}, :processed_at)".format(
+        cols=", ".join(DBC_UPSERT_COLUMNS),
+        params=", ".join(f":{col}" for col in DBC_UPSERT_COLUMNS),
+    )
+)
+
+def save_daily_closing_to_db(merged_data: Dict):
     """
     Save merged daily closing data to SQL database
     
     Args:
         merged_data (Dict): Merged daily closing data
-        session: SQLAlchemy session object
     
     Returns:
         tuple: (success: bool, closing_date: str or None)
@@ -297,81 +427,57 @@ def save_daily_closing_to_db(merged_data: Dict, session):
         cash_outs_data = merged_data.get('cash_outs')
         cash_outs_json = json.dumps(cash_outs_data) if cash_outs_data else None
         
-        # Check if record already exists for this date
-        existing_record = session.query(DailyBookClosingTable).filter_by(closing_date=closing_date).first()
-        if existing_record:
-            print(f"Record already exists for date {closing_date}, updating...")
-            # Update existing record
-            existing_record.total_sales = merged_data.get('total_sales') or existing_record.total_sales
-            existing_record.number_of_transactions = merged_data.get('number_of_transactions') or existing_record.number_of_transactions
-            existing_record.average_sales_per_transaction = merged_data.get('average_sales_per_transaction') or existing_record.average_sales_per_transaction
-            existing_record.nets_qr_amount = merged_data.get('nets_qr_amount') or existing_record.nets_qr_amount
-            existing_record.cash_amount = merged_data.get('cash_amount') or existing_record.cash_amount
-            existing_record.credit_amount = merged_data.get('credit_amount') or existing_record.credit_amount
-            existing_record.nets_amount = merged_data.get('nets_amount') or existing_record.nets_amount
-            existing_record.total_settlement = merged_data.get('total_settlement') or existing_record.total_settlement
-            existing_record.expected_cash_balance = merged_data.get('expected_cash_balance') or existing_record.expected_cash_balance
-            existing_record.cash_outs = cash_outs_json or existing_record.cash_outs
-            existing_record.voided_transactions = merged_data.get('voided_transactions') or existing_record.voided_transactions
-            existing_record.voided_amount = merged_data.get('voided_amount') or existing_record.voided_amount
-            existing_record.processed_at = datetime.now()
-        else:
-            # Create new daily closing record
-            daily_closing_record = DailyBookClosingTable(
-                closing_date=closing_date,
-                total_sales=merged_data.get('total_sales'),
-                number_of_transactions=merged_data.get('number_of_transactions'),
-                average_sales_per_transaction=merged_data.get('average_sales_per_transaction'),
-                nets_qr_amount=merged_data.get('nets_qr_amount'),
-                cash_amount=merged_data.get('cash_amount'),
-                credit_amount=merged_data.get('credit_amount'),
-                nets_amount=merged_data.get('nets_amount'),
-                total_settlement=merged_data.get('total_settlement'),
-                expected_cash_balance=merged_data.get('expected_cash_balance'),
-                cash_outs=cash_outs_json,
-                voided_transactions=merged_data.get('voided_transactions'),
-                voided_amount=merged_data.get('voided_amount')
-            )
-            
-            # Add to session
-            session.add(daily_closing_record)
-        
-        # Commit changes
-        session.commit()
+        params = {col: merged_data.get(col) for col in DBC_UPSERT_COLUMNS}
+        params.update(closing_date=closing_date, cash_outs=cash_outs_json, processed_at=datetime.now())
+        with Session() as session, session.begin():
+            if DBC_UNIQUE_DATE:
+                session.execute(DBC_UPSERT_SQL, params)
+            elif session.execute(DBC_UPDATE_LATEST_SQL, params).rowcount == 0:
+                session.execute(DBC_INSERT_SQL, params)
+        
         print(f"Successfully saved daily closing data for {closing_date}")
         return True, closing_date
         
     except Exception as e:
         print(f"Error saving to database: {e}")
         print(f"Exception type: {type(e).__name__}")
-        session.rollback()
         return False, None
 
 # =============================================================================
 # GOOGLE DRIVE FUNCTIONS FOR DAILY BOOK CLOSING
 # =============================================================================
 
+def drive_query_literal(value: str) -> str:
+    """Quote a value for a Drive search query, escaping backslashes and single quotes"""
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
 class DailyBookClosingSentinel:
     """Process daily book closing images from Google Drive through Vision OCR"""
     
     # Google Drive API configuration
     SCOPES = ['https://www.googleapis.com/auth/drive']
-    CREDENTIALS_FILE = 'credentials.json'
-    TOKEN_FILE = 'token.json'
+    CREDENTIALS_FILE = os.path.join(BASE_DIR, 'credentials.json')
+    TOKEN_FILE = os.path.join(BASE_DIR, 'token.json')
+    
+    # Folder ids found on earlier runs, keyed by the source folder they belong to
+    DRIVE_CACHE_FILE = os.path.join(BASE_DIR, '.drive_cache.json')
     
     # Daily book closing folder ID - UPDATE THIS WITH YOUR ACTUAL FOLDER ID
     DAILY_BOOK_CLOSING_FOLDER_ID = '1sxtFv5mgGSafgWQ3UufW1D2c9f4xE7-Y'
     
-    def __init__(self, local_folder: str = "daily_book_closing_images"):
+    def __init__(self, local_folder: str = os.path.join(BASE_DIR, "daily_book_closing_images"), refresh_cache: bool = False):
         """
         Initialize DailyBookClosingSentinel
         
         Args:
             local_folder: Local folder to download images to
+            refresh_cache: Ignore the cached Drive folder ids and look them up again
         """
         self.service = None
         self.local_folder = local_folder
-        self.processed_folder_id = None
+        self.processed_folder_id = None if refresh_cache else self._load_drive_cache().get('processed_folder_id')
+        self._download_pool = ThreadPoolExecutor(max_workers=DRIVE_DOWNLOAD_WORKERS)
+        self._drive_session = None
         
         # Create local folder if it doesn't exist
         if not os.path.exists(self.local_folder):
@@ -409,10 +515,32 @@ class DailyBookClosingSentinel:
             with open(self.TOKEN_FILE, 'w') as token:
                 token.write(creds.to_json())
         
-        self.service = build('drive', 'v3', credentials=creds)
+        self.service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        self._drive_session = self._build_drive_session(creds)
         print("Authentication successful")
         return True
     
+    def close(self):
+        """Stop the download workers and release the Drive connections"""
+        self._download_pool.shutdown()
+        if self._drive_session is not None:
+            self._drive_session.close()
+    
+    @staticmethod
+    def _build_drive_session(creds) -> AuthorizedSession:
+        """
+        Authorized requests session shared by the download workers. Its connection
+        pool keeps one keep-alive TLS connection per worker, and rate limits and
+        server errors are retried with backoff.
+        """
+        session = AuthorizedSession(creds)
+        session.mount("https://", HTTPAdapter(
+            pool_maxsize=DRIVE_DOWNLOAD_WORKERS,
+            max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                              raise_on_status=False),
+        ))
+        return session
+    
     def get_or_create_folder(self, folder_name: str, parent_folder_id: str) -> str:
         """
         Get folder ID if exists, otherwise create new folder
@@ -426,8 +554,9 @@ class DailyBookClosingSentinel:
         """
         try:
             # Search for existing folder
-            query = f"name='{folder_name}' and '{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            results = self.service.files().list(q=query, fields="files(id,name)").execute()
+            query = (f"name={drive_query_literal(folder_name)} and {drive_query_literal(parent_folder_id)} in parents"
+                     " and mimeType='application/vnd.google-apps.folder' and trashed=false")
+            results = self.service.files().list(q=query, fields="files(id)").execute()
             folders = results.get('files', [])
             
             if folders:
@@ -451,8 +580,36 @@ class DailyBookClosingSentinel:
             print(f"Error creating/finding folder '{folder_name}': {e}")
             raise
     
+    def _load_drive_cache(self) -> Dict:
+        """Cached folder ids for this source folder, or an empty dict"""
+        try:
+            with open(self.DRIVE_CACHE_FILE) as f:
+                return json.load(f).get(self.DAILY_BOOK_CLOSING_FOLDER_ID, {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def _save_drive_cache(self, entry: Dict):
+        """Store folder ids for this source folder, keeping other entries"""
+        try:
+            with open(self.DRIVE_CACHE_FILE) as f:
+                cache = json.load(f)
+            if not isinstance(cache, dict):
+                cache = {}
+        except (OSError, ValueError):
+            cache = {}
+        cache[self.DAILY_BOOK_CLOSING_FOLDER_ID] = entry
+        try:
+            with open(self.DRIVE_CACHE_FILE, 'w') as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            print(f"Warning: could not write {self.DRIVE_CACHE_FILE}: {e}")
+    
     def setup_processing_folders(self):
         """Setup processed_daily_book_closing folder"""
+        if self.processed_folder_id:
+            print(f"Processed folder ID (cached): {self.processed_folder_id}")
+            return
+        
         try:
             # Get parent folder (same parent as daily_book_closing folder)
             daily_folder = self.service.files().get(fileId=self.DAILY_BOOK_CLOSING_FOLDER_ID, fields='parents').execute()
@@ -465,6 +622,10 @@ class DailyBookClosingSentinel:
             self.processed_folder_id = self.get_or_create_folder('processed_daily_book_closing', processed_main_folder_id)
 
             print(f"Processed folder ID: {self.processed_folder_id}")
+            self._save_drive_cache({
+                'processed_folder_id': self.processed_folder_id,
+                'parent_folder_id': parent_folder_id,
+            })
             
         except Exception as e:
             print(f"Error setting up processing folders: {e}")
@@ -480,25 +641,36 @@ class DailyBookClosingSentinel:
             destination_folder_id: Destination folder ID
         """
         try:
-            # Get current file info
-            file_info = self.service.files().get(fileId=file_id, fields='parents').execute()
-            previous_parents = ",".join(file_info.get('parents'))
-            
-            # Move file and rename
-            file = self.service.files().update(
-                fileId=file_id,
-                addParents=destination_folder_id,
-                removeParents=previous_parents,
-                body={'name': new_name},
-                fields='id,parents'
-            ).execute()
-            
+            self.prepare_move(file_id, new_name, destination_folder_id).execute()
             print(f"Moved and renamed file to: {new_name}")
             
         except Exception as e:
             print(f"Error moving/renaming file: {e}")
             raise
     
+    def prepare_move(self, file_id: str, new_name: str, destination_folder_id: str,
+                     previous_parents: Optional[List[str]] = None):
+        """
+        Build (without executing) the request that moves and renames a file
+        
+        Args:
+            file_id: Google Drive file ID
+            new_name: New name for the file
+            destination_folder_id: Destination folder ID
+            previous_parents: Current parent folder IDs, looked up when not given
+        """
+        if previous_parents is None:
+            file_info = self.service.files().get(fileId=file_id, fields='parents').execute()
+            previous_parents = file_info.get('parents')
+        
+        return self.service.files().update(
+            fileId=file_id,
+            addParents=destination_folder_id,
+            removeParents=",".join(previous_parents),
+            body={'name': new_name},
+            fields='id'
+        )
+    
     def download_image_to_file(self, file_id: str, file_name: str) -> str:
         """
         Download image from Google Drive and save to local file
@@ -526,18 +698,25 @@ class DailyBookClosingSentinel:
                 print(f"File already exists: {safe_filename}")
                 return local_file_path
             
-            # Download file content
-            request = self.service.files().get_media(fileId=file_id)
-            file_content = request.execute()
-            
-            # Save to local file
-            with open(local_file_path, 'wb') as f:
-                f.write(file_content)
+            # Stream the file to disk over the shared connection pool
+            try:
+                with self._drive_session.get(f"{DRIVE_FILES_URL}/{file_id}", params={'alt': 'media'},
+                                             stream=True, timeout=DRIVE_DOWNLOAD_TIMEOUT) as response:
+                    response.raise_for_status()
+                    with open(local_file_path, 'wb') as f:
+                        for chunk in response.iter_content(DRIVE_DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                        size = f.tell()
+            except BaseException:
+                # Never leave a partial file behind for the "already exists" check to pick up
+                if os.path.exists(local_file_path):
+                    os.remove(local_file_path)
+                raise
             
-            print(f"Downloaded: {safe_filename} ({len(file_content)} bytes)")
+            print(f"Downloaded: {safe_filename} ({size} bytes)")
             return local_file_path
             
-        except HttpError as e:
+        except requests.HTTPError as e:
             error_msg = f"Google Drive API error downloading {file_name}: {e}"
             print(f"Error: {error_msg}")
             raise Exception(error_msg)
@@ -559,7 +738,7 @@ class DailyBookClosingSentinel:
             results = self.service.files().list(
                 q=query,
                 orderBy='modifiedTime desc',
-                fields="files(id,name,mimeType,size,modifiedTime,createdTime)",
+                fields="files(id,name,createdTime,parents)",
                 supportsAllDrives=True,
                 pageSize=1000
             ).execute()
@@ -593,15 +772,8 @@ class DailyBookClosingSentinel:
             date_str = None
             
             # Look for date patterns in filename
-            import re
-            date_patterns = [
-                r'(\d{4}-\d{2}-\d{2})',  # YYYY-MM-DD
-                r'(\d{4}_\d{2}_\d{2})',  # YYYY_MM_DD
-                r'(\d{2}-\d{2}-\d{4})',  # DD-MM-YYYY
-            ]
-            
-            for pattern in date_patterns:
-                match = re.search(pattern, file_name)
+            for pattern in _DATE_PATTERNS:
+                match = pattern.search(file_name)
                 if match:
                     date_str = match.group(1)
                     # Convert to standard format
@@ -613,13 +785,8 @@ class DailyBookClosingSentinel:
                     break
             
             # If no date in filename, use creation date
-            if not date_str and created_time:
-                try:
-                    from datetime import datetime
-                    created_dt = datetime.fromisoformat(created_time.replace('Z', '+00:00'))
-                    date_str = created_dt.strftime('%Y-%m-%d')
-                except:
-                    date_str = "unknown"
+            if not date_str and _ISO_DATE.fullmatch(created_time[:10]):
+                date_str = created_time[:10]
             
             if not date_str:
                 date_str = "unknown"
@@ -648,35 +815,38 @@ class DailyBookClosingSentinel:
         processed_files = []
         file_mappings = []
         
-        # Download and process each image
-        for i, image in enumerate(images, 1):
+        if not self.service and not self.authenticate():
+            raise Exception("Authentication failed")
+        
+        # Download all images concurrently, keeping their order for the renames below
+        futures = [(image, self._download_pool.submit(self.download_image_to_file, image['id'], image['name']))
+                   for image in images]
+        downloaded = []
+        for image, future in futures:
             try:
-                print(f"\nImage {i}/{len(images)}: {image['name']}")
-                
-                # Download image
-                local_path = self.download_image_to_file(image['id'], image['name'])
-                
-                # Run OCR
-                print(f"Running OCR on {image['name']}...")
-                parsed_json = ocr_daily_closing(local_path, model=model)
-                
-                json_outputs.append(parsed_json)
-                processed_files.append(local_path)
-                file_mappings.append({
-                    'file_id': image['id'],
-                    'file_name': image['name'],
-                    'local_path': local_path
-                })
-                
-                print(f"OCR completed for {image['name']}")
-                
-                # Brief pause between OCR calls
-                if i < len(images):
-                    time.sleep(1)
-                    
+                downloaded.append((image, future.result()))
             except Exception as e:
                 print(f"Error processing {image['name']}: {e}")
+        
+        # Run OCR on all downloaded images at once
+        print(f"Running OCR on {len(downloaded)} images...")
+        ocr_results = ocr_batch([local_path for _, local_path in downloaded], model=model)
+        
+        for (image, local_path), parsed_json in zip(downloaded, ocr_results):
+            if isinstance(parsed_json, Exception):
+                print(f"Error processing {image['name']}: {parsed_json}")
                 continue
+            
+            json_outputs.append(parsed_json)
+            processed_files.append(local_path)
+            file_mappings.append({
+                'file_id': image['id'],
+                'file_name': image['name'],
+                'parents': image.get('parents'),
+                'local_path': local_path
+            })
+            
+            print(f"OCR completed for {image['name']}")
         
         if not json_outputs:
             print(f"No successful OCR results for date {date}")
@@ -688,23 +858,36 @@ class DailyBookClosingSentinel:
         
         # Save merged data to database
         print(f"Saving merged data to database for date {date}...")
-        success, closing_date = save_daily_closing_to_db(merged_data, session)
+        success, closing_date = save_daily_closing_to_db(merged_data)
         
         if success:
             print(f"Successfully saved merged data for {closing_date}")
             
-            # Move and rename files
-            for i, file_info in enumerate(file_mappings, 1):
+            # Move and rename all files in one batch HTTP request
+            def log_move_result(request_id, response, exception):
+                file_name = file_mappings[int(request_id)]['file_name']
+                if exception is not None:
+                    print(f"Error moving file {file_name}: {exception}")
+                else:
+                    print(f"Moved and renamed {file_name}")
+            
+            batch = self.service.new_batch_http_request(callback=log_move_result)
+            date_safe = closing_date.replace('-', '')
+            for i, file_info in enumerate(file_mappings):
                 try:
-                    date_safe = closing_date.replace('-', '')
-                    new_filename = f"{date_safe}_dbc_{i}.jpg"
-                    
+                    new_filename = f"{date_safe}_dbc_{i + 1}.jpg"
                     print(f"Moving {file_info['file_name']} to processed folder as: {new_filename}")
-                    self.move_and_rename_file(file_info['file_id'], new_filename, self.processed_folder_id)
-                    
+                    batch.add(self.prepare_move(file_info['file_id'], new_filename, self.processed_folder_id,
+                                                file_info['parents']),
+                              request_id=str(i))
                 except Exception as e:
                     print(f"Error moving file {file_info['file_name']}: {e}")
             
+            try:
+                batch.execute()
+            except Exception as e:
+                print(f"Error moving files for {closing_date}: {e}")
+            
             return True, processed_files
         else:
             print(f"Failed to save data for date {date}")
@@ -771,11 +954,6 @@ class DailyBookClosingSentinel:
                     processed_with_errors += 1
                     print(f"Failed to process date group: {date}")
                     
-                # Pause between date groups
-                if group_num < total_groups:
-                    print(f"Waiting 2 seconds before next date group...")
-                    time.sleep(2)
-                    
             except Exception as e:
                 processed_with_errors += 1
                 print(f"Error processing date group {date}: {e}")
@@ -818,59 +996,79 @@ def cleanup_local_images(local_folder: str):
         return
 
     try:
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
         deleted_count = 0
 
-        for filename in os.listdir(local_folder):
-            if any(filename.lower().endswith(ext) for ext in image_extensions):
-                file_path = os.path.join(local_folder, filename)
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Error deleting {filename}: {e}")
+        with os.scandir(local_folder) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                        deleted_count += 1
+                    except Exception as e:
+                        print(f"Error deleting {entry.name}: {e}")
 
         print(f"Cleanup completed: Deleted {deleted_count} local image files from {local_folder}")
 
     except Exception as e:
         print(f"Error during cleanup: {e}")
 
-def main():
-    """Main entry point - Automatically process with default settings"""
-
-    # Verify environment
-    if not TOGETHER_API_KEY:
-        print("TOGETHER_API_KEY not found in environment variables")
-        return {"success": False, "error": "API key not found"}
+DEFAULT_MODEL = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
 
-    # Default model and settings
-    model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
+def run(model: str = DEFAULT_MODEL, refresh_cache: bool = False) -> dict:
+    """
+    Process all pending images in-process
 
-    print("🚀 Daily Book Closing Sentinel - Automatic Processing")
-    print(f"🤖 Using model: {model}")
+    Args:
+        refresh_cache: Look the Drive folder ids up again instead of using .drive_cache.json
 
-    # Start processing
-    sentinel = DailyBookClosingSentinel()
+    Returns:
+        {"success": int, "total": int, "errors": int} counts for the run
+    """
+    if not TOGETHER_API_KEY:
+        raise RuntimeError("TOGETHER_API_KEY not found in environment variables")
 
+    sentinel = DailyBookClosingSentinel(refresh_cache=refresh_cache)
     try:
-        result = sentinel.process_all_images(model=model)
+        # process_all_images returns None when there is nothing to process
+        result = sentinel.process_all_images(model=model) or {}
+    finally:
+        # run() is called again by the scheduler and web jobs in the same process
+        sentinel.close()
 
         # Cleanup local images after processing
         print(f"\n🧹 Cleaning up local images...")
         cleanup_local_images(sentinel.local_folder)
 
-        return {
-            "success": True,
-            "total_groups": result["total_groups"],
-            "processed": result["success"],
-            "errors": result["errors"],
-            "success_rate": result["success_rate"]
-        }
+    return {
+        "success": result.get("success", 0),
+        "total": result.get("total_groups", 0),
+        "errors": result.get("errors", 0)
+    }
+
+def main():
+    """Main entry point - Automatically process with default settings"""
+    parser = argparse.ArgumentParser(description="Process daily book closing images from Google Drive")
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='Look up the Drive folder ids again instead of using the cached ones')
+    args = parser.parse_args()
+
+    print("🚀 Daily Book Closing Sentinel - Automatic Processing")
+    print(f"🤖 Using model: {DEFAULT_MODEL}")
 
+    try:
+        stats = run(refresh_cache=args.refresh_cache)
     except Exception as e:
         print(f"Fatal error: {e}")
         return {"success": False, "error": str(e)}
 
+    return {
+        "success": True,
+        "total_groups": stats["total"],
+        "processed": stats["success"],
+        "errors": stats["errors"],
+        "success_rate": (stats["success"]/stats["total"])*100 if stats["total"] > 0 else 0
+    }
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
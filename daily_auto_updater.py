@@ -7,10 +7,12 @@ Runs every day at 11:00 PM IST to update:
 - Invoices (Google Drive invoice processing)
 """
 
-import subprocess
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import sys
 import logging
+import threading
 import pytz
 from datetime import datetime, time
 from pathlib import Path
@@ -29,6 +31,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Step threads that timed out and were left running, by script file. Threads
+# cannot be killed, so the script is not started again while one is still alive
+_abandoned_steps = {}
+
 class DailyAutoUpdater:
     def __init__(self):
         self.base_dir = Path(__file__).parent
@@ -38,8 +44,8 @@ class DailyAutoUpdater:
             'invoices': 'stockSentinel.py'
         }
 
-    def run_script(self, script_name, script_file, timeout=600):
-        """Run a processing script with proper error handling"""
+    def run_script(self, script_name, script_file):
+        """Import a processing script and call its run() in this process"""
         try:
             script_path = self.base_dir / script_file
 
@@ -48,54 +54,63 @@ class DailyAutoUpdater:
                 return False
 
             logger.info(f"🚀 Starting {script_name} update...")
-            logger.info(f"   Running: python3 {script_path}")
-
-            # Run the script
-            result = subprocess.run(
-                ['python3', str(script_path)],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=str(self.base_dir)
-            )
-
-            if result.returncode == 0:
-                logger.info(f"✅ {script_name} update completed successfully")
-
-                # Log summary if available
-                if result.stdout:
-                    output_lines = result.stdout.strip().split('\n')
-                    # Look for summary lines
-                    summary_lines = [line for line in output_lines if '🎯 Summary:' in line or 'Successfully Processed:' in line]
-
-                    if summary_lines:
-                        logger.info(f"   Summary: {summary_lines[-1]}")
-                    else:
-                        # Log last few non-empty lines as summary
-                        non_empty_lines = [line for line in output_lines if line.strip()]
-                        if non_empty_lines:
-                            logger.info(f"   Output: {non_empty_lines[-1]}")
-
-                return True
-
-            else:
-                logger.error(f"❌ {script_name} update failed")
-                if result.stderr:
-                    logger.error(f"   Error: {result.stderr}")
-                if result.stdout:
-                    logger.error(f"   Output: {result.stdout}")
-                return False
-
-        except subprocess.TimeoutExpired:
-            logger.error(f"⏰ {script_name} update timed out after {timeout} seconds")
-            return False
+            logger.info(f"   Running: {script_path.stem}.run()")
+
+            # Imported once per process, so credentials and clients built at
+            # module level are reused by later runs
+            module = importlib.import_module(script_path.stem)
+            stats = module.run()
+
+            logger.info(f"✅ {script_name} update completed successfully")
+            summary = f"{stats.get('success', 0)}/{stats.get('total', 0)} processed"
+            if stats.get('errors'):
+                summary += f", {stats['errors']} errors"
+            logger.info(f"   Summary: {summary}")
+            return True
 
         except Exception as e:
-            logger.error(f"❌ Unexpected error in {script_name} update: {str(e)}")
+            logger.error(f"❌ {script_name} update failed: {str(e)}")
             return False
 
+    def run_script_with_timeout(self, script_name, script_file, timeout):
+        """run_script on its own daemon thread, so a hung Drive, OCR or IMAP call cannot block
+        the nightly run. Returns None when the step timed out and was left running."""
+        previous = _abandoned_steps.get(script_file)
+        if previous is not None and previous.is_alive():
+            logger.error(f"⏰ {script_name} from an earlier run is still hung; not starting it again")
+            return None
+
+        outcome = []
+        worker = threading.Thread(target=lambda: outcome.append(self.run_script(script_name, script_file)),
+                                  name=f"daily-update-{script_file}", daemon=True)
+        worker.start()
+        worker.join(timeout)
+        if worker.is_alive():
+            logger.error(f"⏰ {script_name} update timed out after {timeout} seconds")
+            _abandoned_steps[script_file] = worker
+            return None
+        return outcome[0]
+
+    def run_lane(self, steps):
+        """Run (key, banner, name, timeout) steps one after another; returns {key: success}.
+
+        The steps of a lane must not overlap, so once a step times out (and is
+        still running) the rest of its lane is skipped.
+        """
+        lane_results = {}
+        for index, (key, banner, script_name, timeout) in enumerate(steps):
+            logger.info(f"\n{banner}")
+            success = self.run_script_with_timeout(script_name, self.scripts[key], timeout)
+            lane_results[key] = bool(success)
+            if success is None:
+                for skipped_key, _, skipped_name, _ in steps[index + 1:]:
+                    logger.error(f"⏭️  Skipping {skipped_name}: {script_name} is still running")
+                    lane_results[skipped_key] = False
+                break
+        return lane_results
+
     def run_all_updates(self):
-        """Run all daily updates in sequence"""
+        """Run all daily updates, the mailbox and Drive work side by side"""
         logger.info("="*80)
         logger.info("🌙 DAILY AUTO UPDATER - Starting daily updates at 11:00 PM IST")
         logger.info("="*80)
@@ -105,19 +120,28 @@ class DailyAutoUpdater:
         current_time_ist = datetime.now(ist_timezone)
         logger.info(f"📅 Current IST Time: {current_time_ist.strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
-        results = {}
-
-        # 1. Update Payments (UOB emails)
-        logger.info("\n📧 STEP 1: Processing UOB payment emails...")
-        results['payments'] = self.run_script('Payments', self.scripts['payments'], timeout=120)
-
-        # 2. Update Daily Book Closing (Google Drive sales reports)
-        logger.info("\n📊 STEP 2: Processing daily book closing reports...")
-        results['daily_book_closing'] = self.run_script('Daily Book Closing', self.scripts['daily_book_closing'], timeout=600)
-
-        # 3. Update Invoices (Google Drive invoices)
-        logger.info("\n📄 STEP 3: Processing invoices from Google Drive...")
-        results['invoices'] = self.run_script('Invoices', self.scripts['invoices'], timeout=600)
+        # The scripts resolve their credentials, tokens and download folders from
+        # their own location, so only the import path needs the base directory
+        if str(self.base_dir) not in sys.path:
+            sys.path.insert(0, str(self.base_dir))
+
+        # Payments only talk to the mailbox, so they run alongside the Drive steps.
+        # The two Drive steps share token.json, which a token refresh rewrites, and
+        # the OCR API budget, so they stay one after the other in their own lane
+        lanes = [
+            [('payments', "📧 STEP 1: Processing UOB payment emails...", 'Payments', 120)],
+            [('daily_book_closing', "📊 STEP 2: Processing daily book closing reports...", 'Daily Book Closing', 600),
+             ('invoices', "📄 STEP 3: Processing invoices from Google Drive...", 'Invoices', 600)],
+        ]
+
+        lane_results = {}
+        with ThreadPoolExecutor(max_workers=len(lanes)) as executor:
+            futures = [executor.submit(self.run_lane, lane) for lane in lanes]
+            for future in as_completed(futures):
+                lane_results.update(future.result())
+
+        # Report in step order whatever order the lanes finished in
+        results = {key: lane_results[key] for key in self.scripts}
 
         # Summary
         logger.info("\n" + "="*80)
@@ -143,12 +167,14 @@ class DailyAutoUpdater:
             logger.warning(f"⚠️  {total_updates - successful_updates} update(s) failed. Check logs for details.")
             return False
 
+def run():
+    """Run all daily updates and return True when every step succeeded"""
+    return DailyAutoUpdater().run_all_updates()
+
 def main():
     """Main function to run all daily updates"""
-    updater = DailyAutoUpdater()
-
     try:
-        success = updater.run_all_updates()
+        success = run()
         exit_code = 0 if success else 1
 
         logger.info(f"\n🔚 Daily Auto Updater finished with exit code: {exit_code}")
@@ -0,0 +1,149 @@
+"""
+Shared SQLite connection handling for the web app and the processing scripts.
+
+Connections are opened once with WAL and the tuning pragmas below and then
+reused: reads borrow from a bounded pool, and all writes go through a single
+writer connection.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Use absolute path for database
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dailydelights.db')
+DB_POOL_SIZE = min(32, (os.cpu_count() or 1) * 4)
+
+# Per-connection settings. journal_mode is not among them: WAL is persistent in
+# the database file, so enable_wal() sets it once when this module is loaded
+SQLITE_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA wal_autocheckpoint=1000;
+    PRAGMA busy_timeout=5000;
+"""
+
+
+def enable_wal(path=DB_PATH):
+    """Put the database in WAL mode so readers keep going while a write is in progress"""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def open_sqlite_connection(path=DB_PATH):
+    """Open a tuned SQLite connection; both the raw pool and SQLAlchemy connect through here"""
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+    conn.executescript(SQLITE_PRAGMAS)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Reads are spread over up to ``size`` pooled connections; all writes go
+    through a single writer connection so SQLite never sees competing writers
+    from this process.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        # Bumped after every use of the writer so caches can detect local writes
+        self.write_generation = 0
+
+    def _connect(self):
+        conn = open_sqlite_connection(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    @contextmanager
+    def get(self):
+        """Borrow a read connection, returning it to the pool afterwards"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def writer(self, bump_generation=True):
+        """Hold the single writer connection; anything left uncommitted is rolled back.
+
+        Writes that only maintain derived data (cache tables, job bookkeeping)
+        pass ``bump_generation=False`` so they do not invalidate the caches keyed
+        on ``write_generation``.
+        """
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                if bump_generation:
+                    self.write_generation += 1
+
+    @contextmanager
+    def transaction(self, bump_generation=True):
+        """Hold the writer inside one IMMEDIATE transaction: committed on success, rolled back on error.
+
+        Taking the write lock at BEGIN means a multi-statement write never has
+        to upgrade a read lock halfway through, and everything in the block is
+        made durable by a single commit.
+        """
+        with self.writer(bump_generation) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+
+
+enable_wal(DB_PATH)
+pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE)
+
+
+def get_conn():
+    """Borrow a pooled read connection: ``with get_conn() as conn: ...``"""
+    return pool.get()
+
+
+def get_writer():
+    """Hold the shared writer connection: ``with get_writer() as conn: ...``"""
+    return pool.writer()
+
+
+def transaction(bump_generation=True):
+    """Write inside one IMMEDIATE transaction: ``with transaction() as conn: ...``"""
+    return pool.transaction(bump_generation)
@@ -10,6 +10,20 @@ from typing import List, Dict, Any, Tuple
 from collections import defaultdict
 
 
+INSERT_RECOMMENDATION_QUERY = """
+    INSERT INTO order_recommendations
+    (supplier_name, recommended_date, total_amount_sgd, items_json, notes, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def bulk_insert_recommendations(conn, rows) -> int:
+    """Insert recommendation rows with one prepared statement inside a single transaction"""
+    with conn:
+        cursor = conn.executemany(INSERT_RECOMMENDATION_QUERY, rows)
+    return cursor.rowcount
+
+
 class OrderRecommendationEngine:
     def __init__(self, db_path='dailydelights.db'):
         self.db_path = db_path
@@ -251,7 +265,7 @@ class OrderRecommendationEngine:
                 'invoice_price': round(invoice_unit_price, 2),
                 'price_difference': round(price_diff, 2),
                 'percentage_hike': round(percentage_change, 2),
-                'detected_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'detected_at': datetime.now().isoformat(sep=' ', timespec='seconds')
             })
 
     def save_price_changes(self) -> int:
@@ -630,28 +644,20 @@ class OrderRecommendationEngine:
     def save_recommendations(self, recommendations: List[Dict]) -> int:
         """Save generated recommendations to database"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-
-        saved_count = 0
-        for rec in recommendations:
-            items_json = json.dumps(rec['items'])
-
-            cursor.execute("""
-                INSERT INTO order_recommendations
-                (supplier_name, recommended_date, total_amount_sgd, items_json, notes, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                rec['supplier_name'],
-                rec['recommended_date'],
-                rec['total_amount_sgd'],
-                items_json,
-                rec['notes'],
-                rec.get('status', 'pending')
-            ))
-            saved_count += 1
 
-        conn.commit()
-        conn.close()
+        rows = [(
+            rec['supplier_name'],
+            rec['recommended_date'],
+            rec['total_amount_sgd'],
+            json.dumps(rec['items']),
+            rec['notes'],
+            rec.get('status', 'pending')
+        ) for rec in recommendations]
+
+        try:
+            saved_count = bulk_insert_recommendations(conn, rows) if rows else 0
+        finally:
+            conn.close()
 
         return saved_count
 
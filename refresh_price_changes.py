@@ -155,6 +155,8 @@ class PriceChangeDetector:
         # Compare prices - EXACT MATCH ONLY
         matches_found = 0
         price_increases = 0
+        # One timestamp for the whole run, formatted once
+        detected_at = datetime.now().isoformat(sep=' ', timespec='seconds')
 
         for item_key, invoice_data in invoice_items.items():
             # EXACT match only (no fuzzy matching)
@@ -182,7 +184,7 @@ class PriceChangeDetector:
                     'invoice_price': round(invoice_price, 2),
                     'price_difference': round(price_diff, 2),
                     'percentage_hike': round(percentage_change, 2),
-                    'detected_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    'detected_at': detected_at
                 })
 
         print(f"\n✓ Items compared: {matches_found}")
@@ -10,9 +10,12 @@ import base64
 import mimetypes
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from typing import Set, List, Dict, Optional
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 # Google Drive imports
 from google.auth.transport.requests import Request
@@ -20,6 +23,7 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
 
 # Vision OCR imports
 from PIL import Image
@@ -28,11 +32,40 @@ from pydantic import BaseModel, Field, field_validator
 from sqlalchemy import create_engine, Column, Integer, String, Float, Date
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from db_pool import DB_PATH, open_sqlite_connection
+
 # Load environment variables
 load_dotenv(override=True)
 
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 
+# Credentials, tokens and download folders live next to this script, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Drive downloads are streamed to disk in chunks of this size
+DRIVE_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Local files get_local_images and cleanup_local_images treat as downloaded images (str.endswith takes a tuple)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
+
+# Invoices sent to the OCR API at the same time
+OCR_MAX_WORKERS = 4
+
+# Connect and read timeouts (seconds) for one OCR call
+OCR_TIMEOUT = (5, 120)
+
+# Shared keep-alive connections to the Together AI API. OCR calls are paid POSTs,
+# so only failures where the request was not processed are retried: connection
+# errors and 429/5xx answers. A read timeout is never re-sent
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, connect=3, read=0, other=0, backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False),
+))
+
 # =============================================================================
 # VISION OCR MODELS AND DATABASE SETUP (from together_vision.py)
 # =============================================================================
@@ -137,8 +170,8 @@ class PaymentsTable(Base):
     payment_status = Column(String)
     payment_due_date = Column(Date, nullable=True)
 
-# Create DB connection
-engine = create_engine("sqlite:///dailydelights.db")
+# Create DB connection; connections get the shared WAL tuning pragmas from db_pool
+engine = create_engine(f"sqlite:///{DB_PATH}", creator=open_sqlite_connection, pool_pre_ping=True)
 Base.metadata.create_all(engine)
 
 Session = sessionmaker(bind=engine)
@@ -250,7 +283,7 @@ def ocr(file_path: str, model: str, api_key: str = TOGETHER_API_KEY):
     )
 
     # Make request to Together AI
-    response = requests.post(
+    response = http_session.post(
         "https://api.together.xyz/v1/chat/completions",
         headers={"Authorization": f"Bearer {api_key}"},
         json={
@@ -269,6 +302,7 @@ def ocr(file_path: str, model: str, api_key: str = TOGETHER_API_KEY):
                 "schema": InvoiceResponse.model_json_schema(),
             }
         },
+        timeout=OCR_TIMEOUT,
         verify=False
     )
 
@@ -418,13 +452,13 @@ class StockSentinel:
     
     # Google Drive API configuration
     SCOPES = ['https://www.googleapis.com/auth/drive']  # Changed to full access for moving files
-    CREDENTIALS_FILE = 'credentials.json'
-    TOKEN_FILE = 'token.json'
+    CREDENTIALS_FILE = os.path.join(BASE_DIR, 'credentials.json')
+    TOKEN_FILE = os.path.join(BASE_DIR, 'token.json')
     
     # Your invoices folder ID
     INVOICES_FOLDER_ID = '162d4TyRYwvGXdeVYkZTAY6AMpc50sJtf'
     
-    def __init__(self, local_folder: str = "gdrive_invoices"):
+    def __init__(self, local_folder: str = os.path.join(BASE_DIR, "gdrive_invoices")):
         """
         Initialize StockSentinel
         
@@ -472,7 +506,7 @@ class StockSentinel:
             with open(self.TOKEN_FILE, 'w') as token:
                 token.write(creds.to_json())
         
-        self.service = build('drive', 'v3', credentials=creds)
+        self.service = build('drive', 'v3', credentials=creds, cache_discovery=False)
         print("✅ Authentication successful")
         return True
     
@@ -614,15 +648,22 @@ class StockSentinel:
                 print(f"⭐️ File already exists: {safe_filename}")
                 return local_file_path
             
-            # Download file content
+            # Stream the file to disk chunk by chunk
             request = self.service.files().get_media(fileId=file_id)
-            file_content = request.execute()
-            
-            # Save to local file
-            with open(local_file_path, 'wb') as f:
-                f.write(file_content)
+            try:
+                with open(local_file_path, 'wb') as f:
+                    downloader = MediaIoBaseDownload(f, request, chunksize=DRIVE_DOWNLOAD_CHUNK_SIZE)
+                    done = False
+                    while not done:
+                        _, done = downloader.next_chunk()
+                    size = f.tell()
+            except BaseException:
+                # Never leave a partial file behind for the "already exists" check to pick up
+                if os.path.exists(local_file_path):
+                    os.remove(local_file_path)
+                raise
             
-            print(f"✅ Downloaded: {safe_filename} ({len(file_content)} bytes)")
+            print(f"✅ Downloaded: {safe_filename} ({size} bytes)")
             return local_file_path
             
         except HttpError as e:
@@ -670,12 +711,9 @@ class StockSentinel:
         if not os.path.exists(self.local_folder):
             return []
         
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-        local_images = []
-        
-        for filename in os.listdir(self.local_folder):
-            if any(filename.lower().endswith(ext) for ext in image_extensions):
-                local_images.append(os.path.join(self.local_folder, filename))
+        with os.scandir(self.local_folder) as entries:
+            local_images = [entry.path for entry in entries
+                            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()]
         
         print(f"📂 Found {len(local_images)} local images in {self.local_folder}")
         return local_images
@@ -737,7 +775,7 @@ class StockSentinel:
         print(f"\n✅ Download complete: {len(downloaded_files)} files in {self.local_folder}")
         return downloaded_files
     
-    def process_single_image_file(self, file_path: str, file_id: str, model: str) -> tuple:
+    def process_single_image_file(self, file_path: str, file_id: str, model: str, ocr_future=None) -> tuple:
         """
         Process a single local image file through Vision OCR and save to database
         
@@ -745,6 +783,7 @@ class StockSentinel:
             file_path: Local file path to the image
             file_id: Google Drive file ID for moving the file
             model: Vision model to use for OCR
+            ocr_future: OCR already submitted for this file; its result is used instead of a new call
             
         Returns:
             tuple: (success: bool, supplier_name: str or None, invoice_date: str or None)
@@ -759,8 +798,12 @@ class StockSentinel:
                 return False, None, None
             
             # Run OCR on the local file
-            print(f"🔍 Running OCR on {filename}...")
-            parsed_json = ocr(file_path, model=model)
+            if ocr_future is not None:
+                print(f"🔍 Waiting for OCR on {filename}...")
+                parsed_json = ocr_future.result()
+            else:
+                print(f"🔍 Running OCR on {filename}...")
+                parsed_json = ocr(file_path, model=model)
             
             # Save to database
             print(f"💾 Saving to database...")
@@ -845,65 +888,72 @@ class StockSentinel:
         print(f"\n📄 Step 5: Processing {total_images} local images through OCR...")
         print("-" * 70)
         
-        # Process each local image file
-        for i, file_path in enumerate(local_images, 1):
-            print(f"\n📊 OCR Progress: {i}/{total_images}")
-            print(f"🎯 Processing: {os.path.basename(file_path)}")
-            
-            # Get file ID for this local file
-            file_id = file_mapping.get(file_path)
-            if not file_id:
-                print(f"⚠ Warning: No Google Drive file ID found for {file_path}")
-                processed_with_errors += 1
-                continue
-            
-            success, supplier_name, invoice_date = self.process_single_image_file(file_path, file_id, model)
-            
-            # Generate new filename with supplier name, invoice date, and current timestamp
-            current_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Create safe supplier name
-            supplier_safe = "".join(c for c in (supplier_name or "Unknown_Supplier") if c.isalnum() or c in ('_', '-'))
-            
-            # Format invoice date for filename (replace hyphens with underscores or use fallback)
-            if invoice_date:
-                # Convert YYYY-MM-DD to YYYY_MM_DD for filename
-                invoice_date_safe = invoice_date.replace('-', '_')
-            else:
-                invoice_date_safe = "NoDate"
-            
-            # Get original file extension
-            original_filename = os.path.basename(file_path)
-            file_extension = os.path.splitext(original_filename)[1] or '.jpg'
-            
-            # New filename format: <supplier>_<invoice_date>_<current_timestamp>.<extension>
-            new_filename = f"{supplier_safe}_{invoice_date_safe}_{current_timestamp}{file_extension}"
-            
+        # OCR runs concurrently; saving and moving stay in order on this thread. Only
+        # images that pass the cheap checks (known Drive id, file on disk) are sent
+        with ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS) as ocr_executor:
+            ocr_futures = {file_path: ocr_executor.submit(ocr, file_path, model=model)
+                           for file_path in local_images
+                           if file_mapping.get(file_path) and os.path.exists(file_path)}
             try:
-                if success:
-                    processed_successfully += 1
-                    print(f"✅ Image {i} processed successfully")
+                # Process each local image file
+                for i, file_path in enumerate(local_images, 1):
+                    print(f"\n📊 OCR Progress: {i}/{total_images}")
+                    print(f"🎯 Processing: {os.path.basename(file_path)}")
                     
-                    # Move to processed folder
-                    print(f"📁 Moving to processed_invoices folder as: {new_filename}")
-                    self.move_and_rename_file(file_id, new_filename, self.processed_folder_id)
+                    # Get file ID for this local file
+                    file_id = file_mapping.get(file_path)
+                    if not file_id:
+                        print(f"⚠ Warning: No Google Drive file ID found for {file_path}")
+                        processed_with_errors += 1
+                        continue
                     
-                else:
-                    processed_with_errors += 1
-                    print(f"⚠ Image {i} failed")
+                    success, supplier_name, invoice_date = self.process_single_image_file(
+                        file_path, file_id, model, ocr_future=ocr_futures.get(file_path))
                     
-                    # Move to error folder
-                    print(f"📁 Moving to error_invoices folder as: {new_filename}")
-                    self.move_and_rename_file(file_id, new_filename, self.error_folder_id)
+                    # Generate new filename with supplier name, invoice date, and current timestamp
+                    current_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                     
-            except Exception as e:
-                print(f"⚠ Error moving file: {e}")
-                processed_with_errors += 1
-            
-            # Brief pause between processing to avoid rate limits
-            if i < total_images:
-                print(f"⏳ Waiting 2 seconds before next image...")
-                time.sleep(2)
+                    # Create safe supplier name
+                    supplier_safe = "".join(c for c in (supplier_name or "Unknown_Supplier") if c.isalnum() or c in ('_', '-'))
+                    
+                    # Format invoice date for filename (replace hyphens with underscores or use fallback)
+                    if invoice_date:
+                        # Convert YYYY-MM-DD to YYYY_MM_DD for filename
+                        invoice_date_safe = invoice_date.replace('-', '_')
+                    else:
+                        invoice_date_safe = "NoDate"
+                    
+                    # Get original file extension
+                    original_filename = os.path.basename(file_path)
+                    file_extension = os.path.splitext(original_filename)[1] or '.jpg'
+                    
+                    # New filename format: <supplier>_<invoice_date>_<current_timestamp>.<extension>
+                    new_filename = f"{supplier_safe}_{invoice_date_safe}_{current_timestamp}{file_extension}"
+                    
+                    try:
+                        if success:
+                            processed_successfully += 1
+                            print(f"✅ Image {i} processed successfully")
+                    
+                            # Move to processed folder
+                            print(f"📁 Moving to processed_invoices folder as: {new_filename}")
+                            self.move_and_rename_file(file_id, new_filename, self.processed_folder_id)
+                    
+                        else:
+                            processed_with_errors += 1
+                            print(f"⚠ Image {i} failed")
+                    
+                            # Move to error folder
+                            print(f"📁 Moving to error_invoices folder as: {new_filename}")
+                            self.move_and_rename_file(file_id, new_filename, self.error_folder_id)
+                    
+                    except Exception as e:
+                        print(f"⚠ Error moving file: {e}")
+                        processed_with_errors += 1
+            finally:
+                # If the loop stops early, OCR calls nobody will read are not started
+                for future in ocr_futures.values():
+                    future.cancel()
         
         # Final summary
         print("\n" + "=" * 70)
@@ -946,59 +996,68 @@ def cleanup_local_images(local_folder: str):
         return
 
     try:
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
         deleted_count = 0
 
-        for filename in os.listdir(local_folder):
-            if any(filename.lower().endswith(ext) for ext in image_extensions):
-                file_path = os.path.join(local_folder, filename)
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"⚠ Error deleting {filename}: {e}")
+        with os.scandir(local_folder) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                        deleted_count += 1
+                    except Exception as e:
+                        print(f"⚠ Error deleting {entry.name}: {e}")
 
         print(f"🧹 Cleanup completed: Deleted {deleted_count} local image files from {local_folder}")
 
     except Exception as e:
         print(f"⚠ Error during cleanup: {e}")
 
-def main():
-    """Main entry point - Automatically process with default settings"""
-
-    # Verify environment
-    if not TOGETHER_API_KEY:
-        print("⚠ TOGETHER_API_KEY not found in environment variables")
-        return {"success": False, "error": "API key not found"}
+DEFAULT_MODEL = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
 
-    # Default model and settings
-    model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
+def run(model: str = DEFAULT_MODEL) -> dict:
+    """
+    Process all pending images in-process
 
-    print("🚀 Stock Sentinel - Automatic Invoice Processing")
-    print(f"🤖 Using model: {model}")
+    Returns:
+        {"success": int, "total": int, "errors": int} counts for the run
+    """
+    if not TOGETHER_API_KEY:
+        raise RuntimeError("TOGETHER_API_KEY not found in environment variables")
 
-    # Start processing
     sentinel = StockSentinel()
-
     try:
-        result = sentinel.process_all_images(model=model)
-
+        # process_all_images returns None when there is nothing to process
+        result = sentinel.process_all_images(model=model) or {}
+    finally:
         # Cleanup local images after processing
         print(f"\n🧹 Cleaning up local images...")
         cleanup_local_images(sentinel.local_folder)
 
-        return {
-            "success": True,
-            "total": result["total"],
-            "processed": result["success"],
-            "errors": result["errors"],
-            "success_rate": result["success_rate"]
-        }
+    return {
+        "success": result.get("success", 0),
+        "total": result.get("total", 0),
+        "errors": result.get("errors", 0)
+    }
 
+def main():
+    """Main entry point - Automatically process with default settings"""
+    print("🚀 Stock Sentinel - Automatic Invoice Processing")
+    print(f"🤖 Using model: {DEFAULT_MODEL}")
+
+    try:
+        stats = run()
     except Exception as e:
         print(f"⚠ Fatal error: {e}")
         return {"success": False, "error": str(e)}
 
+    return {
+        "success": True,
+        "total": stats["total"],
+        "processed": stats["success"],
+        "errors": stats["errors"],
+        "success_rate": (stats["success"]/stats["total"])*100 if stats["total"] > 0 else 0
+    }
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import base64
+import logging
 import os
+import sys
 import sqlite3
 import re
 from datetime import datetime, timedelta
@@ -269,7 +271,7 @@ class CompleteEmailProcessor:
         # Check if Gmail service is available
         if self.service is None:
             print("🎯 Summary: Gmail service not available. 0 emails processed.")
-            return
+            return {"success": 0, "total": 0}
 
         yesterday = (datetime.now() - timedelta(hours=24)).strftime("%Y/%m/%d")
         query = f'from:uobgroup.com after:{yesterday}'
@@ -282,7 +284,7 @@ class CompleteEmailProcessor:
 
             if not messages:
                 print("🎯 Summary: 0 emails found in last 24 hours, none to process")
-                return
+                return {"success": 0, "total": 0}
 
             processed_payments = 0
             payment_emails = 0
@@ -318,9 +320,11 @@ class CompleteEmailProcessor:
                     continue
 
             print(f"🎯 Summary: Found {payment_emails} payment emails in last 24 hours, successfully processed {processed_payments}")
+            return {"success": processed_payments, "total": payment_emails}
 
         except Exception as e:
             print(f"🎯 Summary: 0 emails processed due to error: {e}")
+            raise
     
     def get_header_value(self, headers, name):
         """Get header value by name"""
@@ -352,21 +356,30 @@ class CompleteEmailProcessor:
         return content
     
 
-def main():
-    """Main function to fetch and process UOB emails"""
+def run() -> dict:
+    """Fetch and process UOB emails, returning {"success": processed, "total": payment emails}"""
 
-    # Database path
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dailydelights.db')
+    # Credentials, token and database live next to this script, whatever the working directory
+    base_dir = os.path.dirname(os.path.abspath(__file__))
 
     # Initialize the email processor
     processor = CompleteEmailProcessor(
-        credentials_file="credentials_sg_daily_delights_email.json",
-        token_file="token_sg_daily_delights_email.json",
-        db_path=db_path
+        credentials_file=os.path.join(base_dir, "credentials_sg_daily_delights_email.json"),
+        token_file=os.path.join(base_dir, "token_sg_daily_delights_email.json"),
+        db_path=os.path.join(base_dir, 'dailydelights.db')
     )
 
     # Fetch and process UOB emails with payment processing
-    processor.fetch_and_process_uob_emails_24h()
+    return processor.fetch_and_process_uob_emails_24h()
+
+def main():
+    """Main function to fetch and process UOB emails"""
+    try:
+        run()
+    except Exception:
+        logging.exception("UOB payment email processing failed")
+        # Non-zero, as when the error propagated, so the updater's subprocess fallback sees the failure
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file